@@ -0,0 +1,125 @@
+from tensorflow.keras import layers
+from tensorflow.keras.models import Sequential
+
+# Detector architectures. Every model takes float32 RGB input scaled to 0-1,
+# the same input inference.preprocess produces, so the notifier can load any
+# of them. build_model returns (model, frozen base or None, head layers,
+# learning rate); the base and head are used for bottleneck training.
+
+ARCHITECTURES = ("vgg16", "mobilenet_v3_small", "efficientnet_b0", "tiny_cnn")
+
+
+def freeze(base):
+    base.trainable = False
+    for layer in base.layers:
+        layer.trainable = False
+    return base
+
+
+def build_vgg16(input_size):
+    from tensorflow.keras.applications import VGG16
+
+    base = freeze(
+        VGG16(
+            weights="imagenet",
+            include_top=False,
+            input_shape=(input_size, input_size, 3),
+        )
+    )
+    head = [
+        layers.Flatten(),
+        layers.Dense(128, activation="relu"),
+        layers.Dropout(0.5),
+        layers.Dense(1, activation="sigmoid"),
+    ]
+    return base, head, 1e-4
+
+
+def build_mobilenet_v3_small(input_size):
+    from tensorflow.keras.applications import MobileNetV3Small
+
+    # The Keras MobileNetV3 includes its own preprocessing and expects 0-255
+    # input, so scale the 0-1 frames back up first
+    backbone = MobileNetV3Small(
+        weights="imagenet",
+        include_top=False,
+        input_shape=(input_size, input_size, 3),
+    )
+    base = freeze(
+        Sequential(
+            [
+                layers.Input((input_size, input_size, 3)),
+                layers.Rescaling(255.0),
+                backbone,
+            ],
+            name="mobilenet_v3_small_base",
+        )
+    )
+    head = [
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.2),
+        layers.Dense(1, activation="sigmoid"),
+    ]
+    return base, head, 1e-3
+
+
+def build_efficientnet_b0(input_size):
+    # EfficientNet-Lite0 isn't part of keras.applications; B0 is the closest
+    # member of the family that is
+    from tensorflow.keras.applications import EfficientNetB0
+
+    backbone = EfficientNetB0(
+        weights="imagenet",
+        include_top=False,
+        input_shape=(input_size, input_size, 3),
+    )
+    base = freeze(
+        Sequential(
+            [
+                layers.Input((input_size, input_size, 3)),
+                layers.Rescaling(255.0),
+                backbone,
+            ],
+            name="efficientnet_b0_base",
+        )
+    )
+    head = [
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.2),
+        layers.Dense(1, activation="sigmoid"),
+    ]
+    return base, head, 1e-3
+
+
+def build_tiny_cnn(input_size):
+    # Small CNN trained from scratch; enough for one fixed-layout dialog
+    head = [
+        layers.Input((input_size, input_size, 3)),
+        layers.Conv2D(16, 3, strides=2, padding="same", activation="relu"),
+        layers.MaxPooling2D(),
+        layers.Conv2D(32, 3, padding="same", activation="relu"),
+        layers.MaxPooling2D(),
+        layers.Conv2D(64, 3, padding="same", activation="relu"),
+        layers.GlobalAveragePooling2D(),
+        layers.Dense(32, activation="relu"),
+        layers.Dropout(0.3),
+        layers.Dense(1, activation="sigmoid"),
+    ]
+    return None, head, 1e-3
+
+
+def build_model(architecture, input_size=224):
+    builders = {
+        "vgg16": build_vgg16,
+        "mobilenet_v3_small": build_mobilenet_v3_small,
+        "efficientnet_b0": build_efficientnet_b0,
+        "tiny_cnn": build_tiny_cnn,
+    }
+    if architecture not in builders:
+        raise ValueError(
+            f"Unknown architecture '{architecture}'; "
+            f"expected one of {', '.join(ARCHITECTURES)}"
+        )
+    base, head, learning_rate = builders[architecture](input_size)
+    model = Sequential(head if base is None else [base] + head)
+    return model, base, head, learning_rate
@@ -0,0 +1,110 @@
+import functools
+import hashlib
+import os
+import shutil
+import socket
+import threading
+import urllib.request
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse
+
+
+def cache_clip(source, cache_dir):
+    # Return a local copy of an audio clip, downloading remote clips only the
+    # first time they are seen. Local files are copied into the cache so
+    # everything is served from one directory.
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if os.path.exists(source):
+        cached_path = os.path.join(cache_dir, os.path.basename(source))
+        if not os.path.exists(cached_path) or os.path.getmtime(
+            cached_path
+        ) < os.path.getmtime(source):
+            shutil.copyfile(source, cached_path)
+        return cached_path
+
+    digest = hashlib.sha1(source.encode()).hexdigest()[:16]
+    cached_path = os.path.join(cache_dir, f"{digest}.mp3")
+    if not os.path.exists(cached_path):
+        download_path = f"{cached_path}.part"
+        with urllib.request.urlopen(source, timeout=30) as response:
+            with open(download_path, "wb") as download_file:
+                shutil.copyfileobj(response, download_file)
+        os.replace(download_path, cached_path)
+    return cached_path
+
+
+def lan_ip_for(target_host):
+    # Find the local address used to reach target_host, i.e. the one the cast
+    # device can reach us on. No packets are sent for a UDP connect.
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((target_host, 9))
+            return sock.getsockname()[0]
+        except OSError:
+            return socket.gethostbyname(socket.gethostname())
+
+
+class ClipHandler(SimpleHTTPRequestHandler):
+    # Serves only the clips registered through AudioServer.url_for; anything
+    # else, directory listings included, is a 404
+
+    def __init__(self, *args, clips, **kwargs):
+        self.clips = clips
+        super().__init__(*args, **kwargs)
+
+    def send_head(self):
+        name = unquote(urlparse(self.path).path).lstrip("/")
+        if name not in self.clips:
+            self.send_error(404)
+            return None
+        return super().send_head()
+
+    def list_directory(self, path):
+        self.send_error(404)
+        return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AudioServer:
+    # Serves cached clips over HTTP on the LAN so the Google Home fetches
+    # them from this machine instead of a slow redirecting remote URL. It
+    # listens on `host`, the LAN address the cast device reaches, and serves
+    # nothing but the clips handed out by url_for.
+
+    def __init__(self, directory, host, port=0):
+        self.clips = set()
+        handler = functools.partial(
+            ClipHandler, directory=directory, clips=self.clips
+        )
+        self.directory = directory
+        self.host = host
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="audio-server", daemon=True
+        )
+        self.thread.start()
+
+    def url_for(self, path):
+        name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+        self.clips.add(name)
+        return f"http://{self.host}:{self.port}/{quote(name)}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def local_clip_url(source, server):
+    # URL the cast device should play for source, falling back to the
+    # original URL if the clip can't be cached or there is no server
+    if server is None:
+        return source
+    try:
+        return server.url_for(cache_clip(source, server.directory))
+    except Exception as e:
+        print(f"Could not cache {source}, streaming it instead: {e}")
+        return source
@@ -0,0 +1,203 @@
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference import load_image
+
+
+class ResultsManifest:
+    # Append-only JSON lines file of {"path": ..., "score": ...} records, so
+    # an interrupted run can skip every image it already scored. Scores of
+    # unreadable images are recorded as null.
+    #
+    # The first line records the model (path, size and mtime) and ROI the
+    # scores came from; a manifest written with a different model or ROI,
+    # or without that header, is stale and starts over.
+
+    def __init__(self, path, model_path=None, roi=None):
+        self.path = path
+        self.scores = {}
+        self.header = {"model": None, "roi": list(roi) if roi else None}
+        if model_path is not None:
+            stat = os.stat(model_path)
+            self.header["model"] = {
+                "path": os.path.abspath(model_path),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+        stale = False
+        if os.path.exists(path):
+            with open(path) as manifest:
+                try:
+                    stale = json.loads(manifest.readline()) != {
+                        "header": self.header
+                    }
+                except ValueError:
+                    stale = True
+                if not stale:
+                    for line in manifest:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Last line of a run that was killed mid-write
+                            continue
+                        self.scores[record["path"]] = record["score"]
+        if stale:
+            print(f"Discarding {path}: scored with a different model or ROI")
+        if stale or not os.path.exists(path):
+            self.file = open(path, "w")
+            self.file.write(json.dumps({"header": self.header}) + "\n")
+            self.file.flush()
+        else:
+            self.file = open(path, "a")
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.scores
+
+    def get(self, path):
+        return self.scores.get(os.path.abspath(path))
+
+    def record(self, path, score):
+        path = os.path.abspath(path)
+        self.scores[path] = score
+        self.file.write(json.dumps({"path": path, "score": score}) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class FileMover:
+    # Moves files on a small thread pool so classification never waits for
+    # the filesystem
+
+    def __init__(self, workers=4):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="move")
+        self.futures = []
+        self.moved = 0
+        self.failed = 0
+
+    def _move(self, src, dst):
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        shutil.move(src, dst)
+
+    def move(self, src, dst):
+        self.futures.append(self.pool.submit(self._move, src, dst))
+
+    def close(self):
+        for future in self.futures:
+            try:
+                future.result()
+                self.moved += 1
+            except OSError as e:
+                self.failed += 1
+                print(f"Move failed: {e}")
+        self.futures = []
+        self.pool.shutdown()
+
+
+class BatchClassifier:
+    # Scores many image files with a backend. Files are decoded and resized
+    # on a thread pool into reusable batch buffers while the previous batch
+    # is being predicted, and each batch goes through a single
+    # predict_batch call. Memory stays bounded to a few batches however many
+    # paths are given.
+
+    def __init__(
+        self, model, batch_size=64, workers=None, roi=None, manifest=None
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.roi = roi
+        self.manifest = manifest
+        self.prefetch = 2
+
+        width, height = model.input_size
+        self.buffers = [
+            np.empty((batch_size, height, width, 3), dtype=np.float32)
+            for _ in range(self.prefetch + 1)
+        ]
+
+        self.classified = 0
+        self.resumed = 0
+        self.unreadable = 0
+        self.seconds = 0.0
+
+    def load(self, path, out):
+        try:
+            load_image(path, self.model.input_size, self.roi, out=out)
+            return True
+        except ValueError:
+            return False
+
+    def scores(self, paths):
+        # Yields (path, score) for every path; `paths` may be any iterable
+        # and is consumed lazily. Scores taken from the manifest are yielded
+        # straight away, ahead of batches still being decoded. The score is
+        # None for images that could not be read.
+        start = time.perf_counter()
+        with ThreadPoolExecutor(
+            self.workers, thread_name_prefix="decode"
+        ) as pool:
+            pending = deque()
+            chunk = []
+            batches = 0
+
+            def submit():
+                nonlocal chunk, batches
+                buffer = self.buffers[batches % len(self.buffers)]
+                loads = [
+                    pool.submit(self.load, path, buffer[i])
+                    for i, path in enumerate(chunk)
+                ]
+                pending.append((chunk, buffer, loads))
+                chunk = []
+                batches += 1
+
+            for path in paths:
+                if self.manifest is not None and path in self.manifest:
+                    self.resumed += 1
+                    yield path, self.manifest.get(path)
+                    continue
+                chunk.append(path)
+                if len(chunk) == self.batch_size:
+                    submit()
+                    if len(pending) > self.prefetch:
+                        yield from self.predict(*pending.popleft())
+            if chunk:
+                submit()
+            while pending:
+                yield from self.predict(*pending.popleft())
+
+        self.seconds += time.perf_counter() - start
+
+    def predict(self, chunk, buffer, loads):
+        loaded = [future.result() for future in loads]
+        if all(loaded):
+            batch = buffer[: len(chunk)]
+        else:
+            batch = buffer[[i for i, ok in enumerate(loaded) if ok]]
+        predictions = iter(self.model.predict_batch(batch))
+        for path, ok in zip(chunk, loaded):
+            score = float(next(predictions)) if ok else None
+            if ok:
+                self.classified += 1
+            else:
+                self.unreadable += 1
+            if self.manifest is not None:
+                self.manifest.record(path, score)
+            yield path, score
+
+    def stats(self):
+        rate = self.classified / self.seconds if self.seconds else 0.0
+        return (
+            f"Classified {self.classified} images in {self.seconds:.1f}s "
+            f"({rate:.1f} images/sec), {self.resumed} from the manifest, "
+            f"{self.unreadable} unreadable"
+        )
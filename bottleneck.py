@@ -0,0 +1,176 @@
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_index import file_hash
+from training_data import augmentation_layers, decode_and_resize
+
+# Bottleneck feature cache for retraining only the classifier head.
+#
+# The frozen convolutional base produces the same output for the same input,
+# so its features are computed once per (image content hash, augmentation
+# variant) and stored on disk. Variant 0 is the unaugmented image; variants
+# 1..n-1 are random augmentations. Adding screenshots only extracts features
+# for the new files.
+
+
+class FeatureStore:
+    # Features are appended as float16 .npy chunks and read back through
+    # memory maps, so training never has to hold the whole store in RAM.
+    # index.json maps "<hash>:<variant>" to [chunk file, row], under the
+    # signature of the base that produced them (see base_signature); a
+    # store opened for a different base, or without a signature, is
+    # cleared instead of handing out features of the wrong shape or model.
+
+    def __init__(self, directory, signature=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.json")
+        self.signature = signature
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                stored = json.load(index_file)
+            if stored.get("signature") == signature and "features" in stored:
+                self.index = stored["features"]
+            else:
+                print(f"Clearing {directory}: features of a different base")
+                self.clear()
+        self.chunks = {}
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.startswith("chunk_") or name == "index.json":
+                os.remove(os.path.join(self.directory, name))
+        self.index = {}
+
+    @staticmethod
+    def key(content_hash, variant):
+        return f"{content_hash}:{variant}"
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, keys, features):
+        chunk_count = sum(
+            name.startswith("chunk_") for name in os.listdir(self.directory)
+        )
+        chunk_name = f"chunk_{chunk_count:05d}.npy"
+        np.save(
+            os.path.join(self.directory, chunk_name),
+            features.astype(np.float16),
+        )
+        for row, key in enumerate(keys):
+            self.index[key] = [chunk_name, row]
+
+        # Write the index atomically so an interrupted run never leaves it
+        # pointing at rows that don't exist
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as index_file:
+            json.dump(
+                {"signature": self.signature, "features": self.index},
+                index_file,
+            )
+        os.replace(temp_path, self.index_path)
+
+    def get(self, key):
+        chunk_name, row = self.index[key]
+        if chunk_name not in self.chunks:
+            self.chunks[chunk_name] = np.load(
+                os.path.join(self.directory, chunk_name), mmap_mode="r"
+            )
+        return self.chunks[chunk_name][row]
+
+
+def base_signature(base):
+    # What makes cached features valid: the base and its input and output
+    # shapes (INPUT_SIZE changes both)
+    return {
+        "base": base.name,
+        "input_shape": list(base.input_shape[1:]),
+        "output_shape": list(base.output_shape[1:]),
+    }
+
+
+def extract_features(
+    base, paths, store, variants, image_size, batch_size=32, flush_size=1024
+):
+    # Run the frozen base over every (image, variant) not already in the
+    # store. Returns the content hash of each path.
+    hashes = [file_hash(path) for path in paths]
+    todo, seen = [], set()
+    for path, content_hash in zip(paths, hashes):
+        for variant in range(variants):
+            key = store.key(content_hash, variant)
+            if key not in store and key not in seen:
+                seen.add(key)
+                todo.append((path, content_hash, variant))
+    print(
+        f"Extracting {len(todo)} bottleneck features "
+        f"({len(store)} already cached)"
+    )
+
+    augmenter = augmentation_layers()
+    infer = tf.function(lambda images: base(images, training=False))
+    pending_keys, pending_features = [], []
+
+    for start in range(0, len(todo), batch_size):
+        batch = todo[start : start + batch_size]
+        images = tf.stack(
+            [decode_and_resize(path, image_size) for path, _, _ in batch]
+        )
+        images = tf.cast(images, tf.float32) / 255.0
+        augmented = augmenter(images, training=True)
+        is_variant = tf.constant([variant > 0 for _, _, variant in batch])
+        images = tf.where(is_variant[:, None, None, None], augmented, images)
+
+        pending_features.append(infer(images).numpy())
+        pending_keys.extend(
+            store.key(content_hash, variant)
+            for _, content_hash, variant in batch
+        )
+        if len(pending_keys) >= flush_size:
+            store.add(pending_keys, np.concatenate(pending_features))
+            pending_keys, pending_features = [], []
+            print(f"  {start + len(batch)}/{len(todo)}")
+
+    if pending_keys:
+        store.add(pending_keys, np.concatenate(pending_features))
+    return hashes
+
+
+def feature_dataset(
+    store, hashes, labels, variants, batch_size=16, shuffle=False
+):
+    # Batches of (features, label) streamed from the store, with every
+    # variant of every image as its own sample
+    samples = [
+        (store.key(content_hash, variant), label)
+        for content_hash, label in zip(hashes, labels)
+        for variant in range(variants)
+    ]
+    feature_shape = store.get(samples[0][0]).shape
+
+    def generator():
+        order = (
+            np.random.permutation(len(samples))
+            if shuffle
+            else range(len(samples))
+        )
+        for i in order:
+            key, label = samples[i]
+            yield store.get(key).astype(np.float32), np.float32(label)
+
+    dataset = tf.data.Dataset.from_generator(
+        generator,
+        output_signature=(
+            tf.TensorSpec(feature_shape, tf.float32),
+            tf.TensorSpec((), tf.float32),
+        ),
+    )
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE), len(samples)
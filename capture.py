@@ -0,0 +1,173 @@
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+import mss
+import numpy as np
+import screeninfo
+
+
+def parse_roi(value):
+    # Parse a "left,top,width,height" region of interest. When every value is
+    # at most 1 the region is treated as fractions of the image/monitor size,
+    # which keeps it valid across resolutions; otherwise the values are pixels.
+    if not value or not value.strip():
+        return None
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError(f"ROI must be 'left,top,width,height', got {value!r}")
+    if parts[2] <= 0 or parts[3] <= 0:
+        raise ValueError(f"ROI width and height must be positive: {value!r}")
+    return tuple(parts)
+
+
+def resolve_roi(roi, width, height):
+    # Turn a parsed ROI into integer pixel coordinates clipped to the given
+    # width and height. Returns the full area when no ROI is set.
+    if roi is None:
+        return 0, 0, width, height
+
+    left, top, roi_width, roi_height = roi
+    if all(value <= 1 for value in roi):
+        left, roi_width = left * width, roi_width * width
+        top, roi_height = top * height, roi_height * height
+
+    left = min(max(int(round(left)), 0), width - 1)
+    top = min(max(int(round(top)), 0), height - 1)
+    roi_width = max(min(int(round(roi_width)), width - left), 1)
+    roi_height = max(min(int(round(roi_height)), height - top), 1)
+    return left, top, roi_width, roi_height
+
+
+def crop_roi(img, roi):
+    # Crop an HxWxC image to the ROI, used on saved screenshots so training
+    # sees the same region the notifier captures
+    if roi is None:
+        return img
+    left, top, width, height = resolve_roi(roi, img.shape[1], img.shape[0])
+    return img[top : top + height, left : left + width]
+
+
+def capture_region(monitor_index=0, roi=None):
+    # mss region dict for the ROI on the given monitor
+    monitor = screeninfo.get_monitors()[monitor_index]
+    left, top, width, height = resolve_roi(roi, monitor.width, monitor.height)
+    return {
+        "top": monitor.y + top,
+        "left": monitor.x + left,
+        "width": width,
+        "height": height,
+    }
+
+
+class ScreenCapture:
+    # Long-lived screen grabber. Monitor geometry is looked up once and the
+    # same mss instance is reused for every frame, so each grab only copies
+    # the ROI instead of the whole monitor.
+    #
+    # mss keeps per-thread display handles, so create and use an instance from
+    # the same thread.
+
+    def __init__(self, monitor_index=0, roi=None):
+        self.region = capture_region(monitor_index, roi)
+        self.sct = mss.mss()
+        # On HiDPI (Retina) displays the grab has more pixels than the
+        # region's logical size, so take the shape from a real grab
+        shot = self.sct.grab(self.region)
+        self.shape = (shot.height, shot.width, 4)
+
+    def grab(self, out=None):
+        # Returns a BGRA uint8 array of the captured region, written into
+        # `out` when given. A grab of another size (the display's scale
+        # changed since `out` was sized) is resized to fit.
+        shot = self.sct.grab(self.region)
+        if out is None:
+            return np.array(shot)
+        pixels = np.frombuffer(shot.raw, np.uint8).reshape(
+            shot.height, shot.width, 4
+        )
+        if pixels.shape == out.shape:
+            np.copyto(out, pixels)
+        else:
+            cv2.resize(
+                pixels,
+                (out.shape[1], out.shape[0]),
+                dst=out,
+                interpolation=cv2.INTER_AREA,
+            )
+        return out
+
+    def close(self):
+        self.sct.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def foreground_window_title():
+    # Best-effort title of the focused window (application name on macOS);
+    # None when it can't be determined on this platform
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            user32 = ctypes.windll.user32
+            hwnd = user32.GetForegroundWindow()
+            length = user32.GetWindowTextLengthW(hwnd)
+            buffer = ctypes.create_unicode_buffer(length + 1)
+            user32.GetWindowTextW(hwnd, buffer, length + 1)
+            return buffer.value
+        if sys.platform == "darwin":
+            command = [
+                "osascript",
+                "-e",
+                'tell application "System Events" to get name of first '
+                "application process whose frontmost is true",
+            ]
+        else:
+            command = ["xdotool", "getactivewindow", "getwindowname"]
+        result = subprocess.run(
+            command, capture_output=True, text=True, timeout=1
+        )
+    except Exception:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+class ForegroundWatcher:
+    # Tells whether the game window has focus. The focused window is looked
+    # up every `interval` seconds on a thread of its own, since the lookup
+    # can block on a subprocess for up to a second; is_foreground() only
+    # reads the last answer, so the detection path never waits for it.
+    # Unknown focus counts as foreground so detection never slows down just
+    # because the platform isn't supported.
+
+    def __init__(self, title, interval=2.0):
+        self.title = title
+        self.interval = interval
+        self.foreground = True
+        self.stopping = threading.Event()
+        self.thread = None
+        if title:
+            self.thread = threading.Thread(
+                target=self.worker, name="foreground", daemon=True
+            )
+            self.thread.start()
+
+    def worker(self):
+        while True:
+            focused = foreground_window_title()
+            self.foreground = focused is None or self.title in focused
+            if self.stopping.wait(self.interval):
+                return
+
+    def is_foreground(self):
+        return self.foreground
+
+    def close(self):
+        self.stopping.set()
@@ -0,0 +1,245 @@
+import json
+import threading
+import time
+from uuid import UUID
+
+import pychromecast
+from pychromecast.config import APP_MEDIA_RECEIVER
+from pychromecast.socket_client import (
+    CONNECTION_STATUS_CONNECTED,
+    CONNECTION_STATUS_DISCONNECTED,
+    CONNECTION_STATUS_FAILED,
+    CONNECTION_STATUS_FAILED_RESOLVE,
+)
+
+
+class ConnectionListener:
+    # Forwards connection events for one cast object, ignoring events from
+    # objects the manager has already replaced
+
+    def __init__(self, manager, cast):
+        self.manager = manager
+        self.cast = cast
+
+    def new_connection_status(self, status):
+        if self.cast is self.manager.cast:
+            self.manager.connection_status(status)
+
+
+class CastManager:
+    # Keeps a connection to one named cast device in the background.
+    #
+    # The device's address is cached on disk so the next launch can connect
+    # directly instead of waiting on mDNS discovery. pychromecast retries
+    # dropped sockets itself; when it gives up the device is rediscovered
+    # (its address may have changed) without touching the detection loop.
+
+    def __init__(
+        self,
+        friendly_name,
+        cache_path="cast_device.json",
+        connect_tries=3,
+        discovery_timeout=5.0,
+        prelaunch=True,
+        on_connect=None,
+    ):
+        self.friendly_name = friendly_name
+        self.cache_path = cache_path
+        self.connect_tries = connect_tries
+        self.discovery_timeout = discovery_timeout
+        self.prelaunch = prelaunch
+        self.on_connect = on_connect
+
+        self.cast = None
+        self.browser = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.connecting = False
+        self.closed = False
+
+        self.started = time.monotonic()
+        self.ready_seconds = None
+        self.connects = 0
+        self.reconnects = 0
+        self.rediscoveries = 0
+
+    @property
+    def cached_host(self):
+        cached = self.load_cache()
+        return cached["host"] if cached else None
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if cached.get("friendly_name") != self.friendly_name:
+            return None
+        return cached
+
+    def save_cache(self, cast):
+        info = cast.cast_info
+        cached = {
+            "host": info.host,
+            "port": info.port,
+            "uuid": str(info.uuid),
+            "model_name": info.model_name,
+            "friendly_name": info.friendly_name,
+        }
+        with open(self.cache_path, "w") as cache_file:
+            json.dump(cached, cache_file)
+
+    def start(self):
+        self.connect_in_background()
+        return self
+
+    def connect_in_background(self):
+        with self.lock:
+            if self.connecting or self.closed:
+                return
+            self.connecting = True
+        threading.Thread(
+            target=self.connect_loop, name="cast-connect", daemon=True
+        ).start()
+
+    def connect_loop(self):
+        delay = 1.0
+        try:
+            while not self.closed:
+                try:
+                    cast = self.connect_cached() or self.discover()
+                except Exception as e:
+                    print(f"Cast discovery failed: {e}")
+                    cast = None
+                if cast:
+                    self.attach(cast)
+                    return
+                print(
+                    f"No device named '{self.friendly_name}' found. "
+                    f"Retrying in {delay:.0f} seconds..."
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+        finally:
+            with self.lock:
+                self.connecting = False
+
+    def connect_cached(self):
+        cached = self.load_cache()
+        if not cached:
+            return None
+        cast = pychromecast.get_chromecast_from_host(
+            (
+                cached["host"],
+                cached["port"],
+                UUID(cached["uuid"]),
+                cached["model_name"],
+                cached["friendly_name"],
+            ),
+            tries=self.connect_tries,
+        )
+        return self.wait_connected(cast)
+
+    def discover(self):
+        if self.browser:
+            self.browser.stop_discovery()
+            self.browser = None
+        chromecasts, self.browser = pychromecast.get_listed_chromecasts(
+            friendly_names=[self.friendly_name],
+            tries=self.connect_tries,
+            discovery_timeout=self.discovery_timeout,
+        )
+        if not chromecasts:
+            return None
+        return self.wait_connected(chromecasts[0])
+
+    def wait_connected(self, cast):
+        try:
+            cast.wait(timeout=self.discovery_timeout)
+        except Exception as e:
+            print(f"Could not connect to '{self.friendly_name}': {e}")
+            cast.disconnect(timeout=0)
+            return None
+        return cast
+
+    def attach(self, cast):
+        previous, self.cast = self.cast, cast
+        if previous is not None:
+            previous.disconnect(timeout=0)
+        cast.register_connection_listener(ConnectionListener(self, cast))
+        self.connects += 1
+        self.save_cache(cast)
+        self.prepare(cast)
+
+        if self.ready_seconds is None:
+            self.ready_seconds = time.monotonic() - self.started
+            print(
+                f"Found '{self.friendly_name}' at {cast.cast_info.host} "
+                f"in {self.ready_seconds:.2f}s"
+            )
+        self.ready.set()
+
+    def prepare(self, cast):
+        if self.on_connect:
+            self.on_connect(cast)
+        # Launch the media receiver ahead of time so the first play_media
+        # doesn't wait for an app launch, unless something else is playing
+        if self.prelaunch and cast.is_idle:
+            try:
+                cast.start_app(APP_MEDIA_RECEIVER, force_launch=False)
+            except Exception as e:
+                print(f"Could not pre-launch the media receiver: {e}")
+
+    def connection_status(self, status):
+        # Called from pychromecast's socket thread; must not block
+        if status.status == CONNECTION_STATUS_CONNECTED:
+            if not self.ready.is_set() and self.cast is not None:
+                self.reconnects += 1
+                print(f"Reconnected to '{self.friendly_name}'")
+                threading.Thread(
+                    target=self.prepare, args=(self.cast,), daemon=True
+                ).start()
+                self.ready.set()
+        elif status.status in (
+            CONNECTION_STATUS_FAILED,
+            CONNECTION_STATUS_FAILED_RESOLVE,
+            CONNECTION_STATUS_DISCONNECTED,
+        ):
+            # pychromecast gave up on this address
+            self.ready.clear()
+            if not self.closed:
+                self.rediscoveries += 1
+                print(f"Lost '{self.friendly_name}', rediscovering...")
+                self.connect_in_background()
+        else:
+            # Connection lost or being retried by pychromecast
+            self.ready.clear()
+
+    def get(self, timeout=None):
+        # Wait for a connected device; raises if none is ready in time
+        if not self.ready.wait(timeout):
+            raise ConnectionError(f"'{self.friendly_name}' is not connected")
+        return self.cast
+
+    def close(self):
+        self.closed = True
+        try:
+            if self.cast:
+                self.cast.disconnect(timeout=0)
+            if self.browser:
+                self.browser.stop_discovery()
+        except Exception:
+            pass
+
+    def stats(self):
+        ready = (
+            f"ready after {self.ready_seconds:.2f}s"
+            if self.ready_seconds is not None
+            else "not ready"
+        )
+        return (
+            f"Cast '{self.friendly_name}': {ready}, {self.connects} "
+            f"connects, {self.reconnects} reconnects, "
+            f"{self.rediscoveries} rediscoveries"
+        )
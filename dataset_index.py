@@ -0,0 +1,339 @@
+import hashlib
+import os
+import sqlite3
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as image_file:
+        for block in iter(lambda: image_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def perceptual_hash(img):
+    # 64-bit DCT hash: the sign of the lowest 8x8 frequencies of a 32x32
+    # grayscale thumbnail relative to their median. Near-identical frames
+    # differ in only a few bits.
+    if img.ndim == 3:
+        code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        img = cv2.cvtColor(img, code)
+    thumb = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(np.float32(thumb))[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+def phash_buckets(rows, max_distance, group):
+    # Candidate lists for perceptual hashes within max_distance bits. The
+    # hash is split into max_distance + 1 bands; any two hashes that close
+    # agree exactly on at least one band, so only rows sharing a band (and
+    # `group(row)`) need comparing.
+    bands = max_distance + 1
+    width = 64 // bands
+    buckets = defaultdict(list)
+    for i, row in enumerate(rows):
+        for band in range(bands):
+            key = (row["phash"] >> (band * width)) & ((1 << width) - 1)
+            buckets[group(row), band, key].append(i)
+    return buckets.values()
+
+
+class DatasetIndex:
+    # Persistent SQLite index of the screenshot dataset: one row per image
+    # with its content hash, perceptual hash, split (train/val/screenshots),
+    # label, dimensions and the last model prediction.
+    #
+    # sync() only hashes files that are new or whose size or mtime changed,
+    # and recognizes moved files by content hash so their predictions carry
+    # over. Utilities that move files call move() so the index stays current
+    # without rescanning.
+
+    def __init__(self, path="dataset_index.sqlite3"):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                phash INTEGER,
+                split TEXT,
+                label TEXT,
+                width INTEGER,
+                height INTEGER,
+                size INTEGER,
+                mtime REAL,
+                prediction REAL,
+                predicted_by TEXT,
+                predicted_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS images_content_hash
+                ON images (content_hash);
+            CREATE INDEX IF NOT EXISTS images_phash ON images (phash);
+            CREATE INDEX IF NOT EXISTS images_split_label
+                ON images (split, label);
+            """)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def classify_path(path, root):
+        # split and label from <root>/<split>/[<label>/]<file>
+        parts = os.path.relpath(path, root).split(os.sep)
+        split = parts[0] if len(parts) > 1 else None
+        label = parts[1] if len(parts) > 2 else None
+        return split, label
+
+    def sync(self, root, directories=("train", "val", "screenshots")):
+        # Bring the index in line with the files under root/<directories>.
+        # Returns counts of added, moved, updated and removed rows.
+        root = os.path.abspath(root)
+        known = {
+            row["path"]: row
+            for row in self.db.execute("SELECT path, size, mtime FROM images")
+        }
+        seen = set()
+        added = moved = updated = 0
+
+        for directory in directories:
+            top = os.path.join(root, directory)
+            for dirpath, _, filenames in os.walk(top):
+                for filename in filenames:
+                    if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    seen.add(path)
+                    stat = os.stat(path)
+                    row = known.get(path)
+                    if (
+                        row is not None
+                        and row["size"] == stat.st_size
+                        and row["mtime"] == stat.st_mtime
+                    ):
+                        continue
+
+                    split, label = self.classify_path(path, root)
+                    content_hash = file_hash(path)
+                    previous = self.db.execute(
+                        "SELECT path FROM images WHERE content_hash = ?",
+                        (content_hash,),
+                    ).fetchall()
+                    gone = [
+                        other["path"]
+                        for other in previous
+                        if not os.path.exists(other["path"])
+                    ]
+                    if row is None and gone:
+                        # Same content at a new path: keep its prediction
+                        self.db.execute(
+                            "UPDATE images SET path = ?, split = ?, "
+                            "label = ?, mtime = ? WHERE path = ?",
+                            (path, split, label, stat.st_mtime, gone[0]),
+                        )
+                        moved += 1
+                        continue
+
+                    img = cv2.imread(path, cv2.IMREAD_COLOR)
+                    phash = height = width = None
+                    if img is not None:
+                        height, width = img.shape[:2]
+                        phash = perceptual_hash(img)
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO images (path, content_hash, "
+                        "phash, split, label, width, height, size, mtime) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            path,
+                            content_hash,
+                            phash,
+                            split,
+                            label,
+                            width,
+                            height,
+                            stat.st_size,
+                            stat.st_mtime,
+                        ),
+                    )
+                    if row is None:
+                        added += 1
+                    else:
+                        updated += 1
+
+        # Drop rows for files that no longer exist under the synced tops
+        tops = tuple(
+            os.path.join(root, directory) + os.sep for directory in directories
+        )
+        removed = [
+            (path,)
+            for path in known
+            if path.startswith(tops)
+            and path not in seen
+            and not os.path.exists(path)
+        ]
+        self.db.executemany("DELETE FROM images WHERE path = ?", removed)
+        self.db.commit()
+        return {
+            "added": added,
+            "moved": moved,
+            "updated": updated,
+            "removed": len(removed),
+        }
+
+    def move(self, src, dst, root=None):
+        # Record a file move made by a utility. With `root`, split and label
+        # are updated from the new location.
+        src, dst = os.path.abspath(src), os.path.abspath(dst)
+        if root is None:
+            self.db.execute(
+                "UPDATE images SET path = ? WHERE path = ?", (dst, src)
+            )
+        else:
+            split, label = self.classify_path(dst, os.path.abspath(root))
+            self.db.execute(
+                "UPDATE images SET path = ?, split = ?, label = ? "
+                "WHERE path = ?",
+                (dst, split, label, src),
+            )
+
+    def remove(self, path):
+        self.db.execute(
+            "DELETE FROM images WHERE path = ?", (os.path.abspath(path),)
+        )
+
+    def commit(self):
+        self.db.commit()
+
+    def count(self, split, label=None):
+        if label is None:
+            query = "SELECT COUNT(*) FROM images WHERE split = ?"
+            args = (split,)
+        else:
+            query = "SELECT COUNT(*) FROM images WHERE split = ? AND label = ?"
+            args = (split, label)
+        return self.db.execute(query, args).fetchone()[0]
+
+    def counts(self):
+        # {(split, label): count} answered from the index
+        return {
+            (row["split"], row["label"]): row["n"]
+            for row in self.db.execute(
+                "SELECT split, label, COUNT(*) AS n FROM images "
+                "GROUP BY split, label"
+            )
+        }
+
+    def paths(self, split, label=None):
+        if label is None:
+            rows = self.db.execute(
+                "SELECT path FROM images WHERE split = ? ORDER BY path",
+                (split,),
+            )
+        else:
+            rows = self.db.execute(
+                "SELECT path FROM images WHERE split = ? AND label = ? "
+                "ORDER BY path",
+                (split, label),
+            )
+        return [row["path"] for row in rows]
+
+    def get(self, path):
+        return self.db.execute(
+            "SELECT * FROM images WHERE path = ?", (os.path.abspath(path),)
+        ).fetchone()
+
+    def record_prediction(self, path, score, model_name=None):
+        self.db.execute(
+            "UPDATE images SET prediction = ?, predicted_by = ?, "
+            "predicted_at = ? WHERE path = ?",
+            (score, model_name, time.time(), os.path.abspath(path)),
+        )
+
+    def exact_duplicates(self):
+        # Groups of paths with identical content in the same split and label
+        groups = defaultdict(list)
+        for row in self.db.execute(
+            "SELECT path, content_hash, split, label FROM images "
+            "WHERE content_hash IN (SELECT content_hash FROM images "
+            "GROUP BY content_hash, split, label HAVING COUNT(*) > 1) "
+            "ORDER BY path"
+        ):
+            key = (row["content_hash"], row["split"], row["label"])
+            groups[key].append(row["path"])
+        return [paths for paths in groups.values() if len(paths) > 1]
+
+    def _phash_rows(self):
+        return self.db.execute(
+            "SELECT path, phash, split, label FROM images "
+            "WHERE phash IS NOT NULL ORDER BY path"
+        ).fetchall()
+
+    def near_duplicates(self, max_distance=4):
+        # Pairs (kept, duplicate) of images in the same split and label whose
+        # perceptual hashes differ by at most max_distance bits. Images in
+        # different splits or labels are never duplicates of each other; see
+        # cross_matches for those.
+        rows = self._phash_rows()
+        duplicate_of = {}
+        for members in phash_buckets(
+            rows, max_distance, lambda row: (row["split"], row["label"])
+        ):
+            for a_pos, a in enumerate(members):
+                if a in duplicate_of:
+                    continue
+                for b in members[a_pos + 1 :]:
+                    if b in duplicate_of:
+                        continue
+                    distance = hamming(rows[a]["phash"], rows[b]["phash"])
+                    if distance <= max_distance:
+                        duplicate_of[b] = a
+        return [
+            (rows[kept]["path"], rows[duplicate]["path"])
+            for duplicate, kept in sorted(duplicate_of.items())
+        ]
+
+    def cross_matches(self, max_distance=4):
+        # Rows (a, b, distance) of near-identical images filed under a
+        # different split or label: the same screen labeled both ways is
+        # probably a labeling error, and the same screen in train and val
+        # leaks across the split. Reported only; neither copy is a
+        # duplicate to throw away.
+        rows = self._phash_rows()
+        pairs = set()
+        for members in phash_buckets(rows, max_distance, lambda row: None):
+            for a_pos, a in enumerate(members):
+                for b in members[a_pos + 1 :]:
+                    if (rows[a]["split"], rows[a]["label"]) == (
+                        rows[b]["split"],
+                        rows[b]["label"],
+                    ):
+                        continue
+                    distance = hamming(rows[a]["phash"], rows[b]["phash"])
+                    if distance <= max_distance:
+                        pairs.add((a, b, distance))
+        return [
+            (rows[a], rows[b], distance) for a, b, distance in sorted(pairs)
+        ]
@@ -0,0 +1,119 @@
+import time
+from collections import deque
+
+POLICIES = ("threshold", "k_of_n", "ema", "rising_edge")
+
+
+class PopDecider:
+    # Turns the stream of per-frame model scores into pop notifications.
+    #
+    # Each policy decides whether the queue pop is currently "active":
+    #   threshold    the latest score is at or above `threshold`
+    #   k_of_n       at least `k` of the last `n` scores are above `threshold`
+    #   ema          an exponential moving average of the scores crosses
+    #                `threshold`, and stays active until it drops below
+    #                `release` (hysteresis)
+    #   rising_edge  the latest score is above `threshold` and one of the
+    #                last `n` scores was below `release`, so a score that
+    #                sits high on a static screen can't trigger
+    # A notification fires when the state goes from inactive to active and
+    # the cooldown since the previous notification has passed.
+
+    def __init__(
+        self,
+        policy="threshold",
+        threshold=0.95,
+        release=0.5,
+        k=2,
+        n=3,
+        alpha=0.5,
+        cooldown=15.0,
+        clock=time.monotonic,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown decision policy '{policy}'; "
+                f"expected one of {', '.join(POLICIES)}"
+            )
+        self.policy = policy
+        self.threshold = threshold
+        self.release = release
+        self.k = k
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.clock = clock
+
+        self.scores = deque(maxlen=n)
+        self.ema = None
+        self.active = False
+        self.last_fired = None
+        self.first_positive = None
+
+        self.pops = 0
+        self.latencies = []
+
+    def is_active(self, score):
+        if self.policy == "threshold":
+            return score >= self.threshold
+        if self.policy == "k_of_n":
+            positives = sum(s >= self.threshold for s in self.scores)
+            return positives >= self.k
+        if self.policy == "ema":
+            if self.active:
+                return self.ema >= self.release
+            return self.ema >= self.threshold
+        # rising_edge; the latest score is already in self.scores
+        previous = list(self.scores)[:-1]
+        if self.active:
+            return score >= self.release
+        return score >= self.threshold and any(
+            s < self.release for s in previous
+        )
+
+    def update(self, score, timestamp=None):
+        # Feed one score; returns True when a notification should be sent
+        now = self.clock() if timestamp is None else timestamp
+        self.scores.append(score)
+        self.ema = (
+            score
+            if self.ema is None
+            else self.alpha * score + (1 - self.alpha) * self.ema
+        )
+
+        # Decision latency is measured from the first frame above the
+        # threshold to the notification
+        if score >= self.threshold:
+            if self.first_positive is None:
+                self.first_positive = now
+        elif all(s < self.threshold for s in self.scores):
+            self.first_positive = None
+
+        was_active, self.active = self.active, self.is_active(score)
+        if not self.active or was_active:
+            return False
+        if (
+            self.last_fired is not None
+            and now - self.last_fired < self.cooldown
+        ):
+            return False
+
+        self.last_fired = now
+        self.pops += 1
+        if self.first_positive is not None:
+            self.latencies.append(now - self.first_positive)
+            self.first_positive = None
+        return True
+
+    @property
+    def last_latency(self):
+        return self.latencies[-1] if self.latencies else None
+
+    def stats(self):
+        if self.latencies:
+            latency = (
+                f"decision latency avg {sum(self.latencies) / len(self.latencies):.2f}s, "
+                f"max {max(self.latencies):.2f}s"
+            )
+        else:
+            latency = "no decisions yet"
+        return f"Decider ({self.policy}): {self.pops} pops, {latency}"
@@ -0,0 +1,106 @@
+import os
+import time
+
+from capture import parse_roi
+from decision import PopDecider
+from frame_gate import FrameGate
+from scheduler import FrameScheduler
+from template_matcher import TemplateDetector, TemplateMatcher
+
+# The detection path's components as configured from the environment, shared
+# by wow_queue_notifier.py and the offline replay (replay.py) so both run
+# exactly the same gate, decider, scheduler and detector. The clock is
+# time.monotonic live and a VirtualClock in replays.
+
+
+def frame_gate_from_env(clock=time.monotonic):
+    # Only run the model when the screen changed by more than
+    # FRAME_DIFF_THRESHOLD percent of its cells since the last classified
+    # frame, or when FRAME_FORCE_RECHECK_SECONDS have passed without a
+    # classification
+    return FrameGate(
+        threshold=float(os.environ.get("FRAME_DIFF_THRESHOLD", "0.5")),
+        force_interval=float(
+            os.environ.get("FRAME_FORCE_RECHECK_SECONDS", "10")
+        ),
+        clock=clock,
+    )
+
+
+def decider_from_env(clock=time.monotonic):
+    # Confirm pops over several frames before notifying. DECISION_POLICY is
+    # one of threshold (single frame, the default), k_of_n, ema or
+    # rising_edge.
+    return PopDecider(
+        policy=os.environ.get("DECISION_POLICY", "threshold"),
+        threshold=float(os.environ.get("POP_THRESHOLD", "0.95")),
+        release=float(os.environ.get("POP_RELEASE_THRESHOLD", "0.5")),
+        k=int(os.environ.get("DECISION_K", "2")),
+        n=int(os.environ.get("DECISION_N", "3")),
+        alpha=float(os.environ.get("DECISION_EMA_ALPHA", "0.5")),
+        cooldown=float(os.environ.get("NOTIFY_COOLDOWN_SECONDS", "15")),
+        clock=clock,
+    )
+
+
+def scheduler_from_env(clock=time.monotonic, sleep=time.sleep):
+    # Poll quickly while the screen is changing or the score is rising and
+    # slowly while nothing happens or the game isn't focused
+    return FrameScheduler(
+        fast_period=float(os.environ.get("CAPTURE_FAST_PERIOD", "0.2")),
+        normal_period=float(os.environ.get("CAPTURE_PERIOD", "1.0")),
+        slow_period=float(os.environ.get("CAPTURE_SLOW_PERIOD", "4.0")),
+        idle_after=float(os.environ.get("CAPTURE_IDLE_AFTER_SECONDS", "30")),
+        fast_hold=float(os.environ.get("CAPTURE_FAST_HOLD_SECONDS", "5")),
+        rise_threshold=float(os.environ.get("SCORE_RISE_THRESHOLD", "0.3")),
+        clock=clock,
+        sleep=sleep,
+    )
+
+
+def template_source_from_env():
+    # Glob of labeled queue pop screenshots to build templates from, or None
+    # unless TEMPLATE_MATCHING=1
+    if os.environ.get("TEMPLATE_MATCHING", "0") != "1":
+        return None
+    return os.environ.get(
+        "TEMPLATE_SOURCE", os.path.join("train", "queue_pop", "*")
+    )
+
+
+def detector_from_env(model, templates=None):
+    # The model, or with `templates` (and any usable among them) a
+    # TemplateDetector in front of it that only runs the model when the
+    # template score is between TEMPLATE_MISS_SCORE and TEMPLATE_HIT_SCORE
+    # (see utilities/compare_detectors.py --sweep). Templates are cropped to
+    # CAPTURE_ROI like the captured frames.
+    if not templates:
+        return model
+    matcher = TemplateMatcher.from_glob(
+        templates,
+        model.input_size,
+        roi=parse_roi(os.environ.get("CAPTURE_ROI")),
+    )
+    if not matcher.templates:
+        return model
+    return TemplateDetector(
+        model,
+        matcher,
+        hit=float(os.environ.get("TEMPLATE_HIT_SCORE", "0.8")),
+        miss=float(os.environ.get("TEMPLATE_MISS_SCORE", "0.4")),
+    )
+
+
+def handle_detection(result, scheduler, notify, foreground=True):
+    # What every processed frame does to the schedule, and the
+    # notifications a pop sends; `notify(channel, payload)` is the
+    # dispatcher's, or a fake sink's in replays
+    scheduler.update(
+        changed=result.changed,
+        score=result.score if result.classified else None,
+        foreground=foreground,
+    )
+    if result.popped:
+        notify("pushover", "The queue has popped!")
+        # Play "Queue popped" WAV
+        notify("google_home", "queue_popped")
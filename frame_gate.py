@@ -0,0 +1,85 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameGate:
+    # Cheap pre-filter that decides whether a frame differs enough from the
+    # last classified frame to be worth running the model on.
+    #
+    # Frames are reduced to a small grayscale thumbnail and compared cell by
+    # cell. The change score is the percentage of cells whose intensity moved
+    # by more than `pixel_delta`, which (unlike a plain mean difference) stays
+    # sensitive to a small dialog appearing on an otherwise static screen.
+
+    def __init__(
+        self,
+        threshold=0.5,
+        force_interval=10.0,
+        pixel_delta=12,
+        size=(64, 64),
+        clock=time.monotonic,
+    ):
+        self.threshold = threshold
+        self.force_interval = force_interval
+        self.pixel_delta = pixel_delta
+        self.size = size
+        self.clock = clock
+
+        self.reference = None
+        self.last_run_time = None
+        self.last_score = None
+        self.changed = False
+        self.runs = 0
+        self.skips = 0
+        self.forced = 0
+
+    def thumbnail(self, img):
+        if img.ndim == 3:
+            code = (
+                cv2.COLOR_BGRA2GRAY
+                if img.shape[2] == 4
+                else cv2.COLOR_BGR2GRAY
+            )
+            img = cv2.cvtColor(img, code)
+        return cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+
+    def score(self, thumb):
+        if self.reference is None:
+            return 100.0
+        diff = cv2.absdiff(thumb, self.reference)
+        return 100.0 * np.count_nonzero(diff > self.pixel_delta) / diff.size
+
+    def should_classify(self, img):
+        # Returns True when the model should run on `img`. The reference frame
+        # is only replaced when the model runs, so slow drift still adds up
+        # until it crosses the threshold.
+        now = self.clock()
+        thumb = self.thumbnail(img)
+        self.last_score = self.score(thumb)
+
+        self.changed = changed = self.last_score >= self.threshold
+        overdue = (
+            self.last_run_time is None
+            or now - self.last_run_time >= self.force_interval
+        )
+        if not changed and not overdue:
+            self.skips += 1
+            return False
+
+        if not changed:
+            self.forced += 1
+        self.runs += 1
+        self.reference = thumb
+        self.last_run_time = now
+        return True
+
+    def stats(self):
+        total = self.runs + self.skips
+        skipped = 100.0 * self.skips / total if total else 0.0
+        return (
+            f"Frame gate: {self.runs} classified ({self.forced} forced), "
+            f"{self.skips} skipped ({skipped:.1f}% of {total} frames), "
+            f"last score {self.last_score or 0.0:.2f}%"
+        )
@@ -0,0 +1,191 @@
+import os
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from capture import crop_roi
+
+# Inference backends for the queue pop detector. The backend is picked from
+# the model file's extension so the notifier can run a TFLite or ONNX export
+# without importing TensorFlow at all. Backend libraries are imported lazily
+# for the same reason.
+
+
+def preprocess(img, size, roi=None, out=None):
+    # Convert a BGR/BGRA uint8 frame (mss grab or cv2.imread) into the
+    # float32 RGB 0-1 input the model was trained on. `size` is the model's
+    # (width, height); pass `out` to write into an existing float32 buffer
+    # instead of allocating a new array.
+    img = crop_roi(img, roi)
+    code = cv2.COLOR_BGRA2RGB if img.shape[2] == 4 else cv2.COLOR_BGR2RGB
+    img = cv2.cvtColor(cv2.resize(img, size), code)
+    if out is None:
+        out = np.empty(img.shape, dtype=np.float32)
+    return np.multiply(img, 1.0 / 255.0, out=out, casting="unsafe")
+
+
+def load_image(path, size, roi=None, out=None):
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"Could not read image {path}")
+    return preprocess(img, size, roi, out)
+
+
+class Backend(ABC):
+    # Shared single-frame/batch plumbing. Inputs are copied into one input
+    # buffer allocated up front and reused for every call, and each backend
+    # runs a warm-up inference when loaded so the first real frame doesn't
+    # pay for graph tracing or kernel initialization.
+    name = None
+    max_batch_size = 64
+
+    def allocate(self, height, width, channels=3):
+        self.input_size = (int(width), int(height))
+        self.buffer = np.zeros(
+            (self.max_batch_size, int(height), int(width), int(channels)),
+            dtype=np.float32,
+        )
+        # Callers can preprocess straight into this slot to skip a copy
+        self.frame = self.buffer[0]
+        self.run(self.buffer[:1])
+
+    @abstractmethod
+    def run(self, batch):
+        # Returns one score per image for a float32 NHWC batch
+        ...
+
+    def predict_one(self, img):
+        if img is not self.frame:
+            np.copyto(self.frame, img)
+        return float(self.run(self.buffer[:1])[0])
+
+    def predict_batch(self, images):
+        scores = []
+        for start in range(0, len(images), self.max_batch_size):
+            chunk = images[start : start + self.max_batch_size]
+            for i, img in enumerate(chunk):
+                self.buffer[i] = img
+            scores.append(self.run(self.buffer[: len(chunk)]))
+        if not scores:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(scores)
+
+
+class KerasBackend(Backend):
+    name = "keras"
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+        from tensorflow.keras.models import load_model
+
+        self.model = load_model(model_path, compile=False)
+        _, height, width, channels = self.model.input_shape
+
+        # A tf.function with a fixed signature is traced once and then called
+        # directly, skipping the data adapter and batching machinery that
+        # model.predict sets up on every call
+        self.infer = tf.function(
+            lambda batch: self.model(batch, training=False),
+            input_signature=[
+                tf.TensorSpec((None, height, width, channels), tf.float32)
+            ],
+        )
+        self.allocate(height, width, channels)
+
+    def run(self, batch):
+        return self.infer(batch).numpy()[:, 0]
+
+
+class TFLiteBackend(Backend):
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        # Prefer a standalone runtime; fall back to the interpreter bundled
+        # with TensorFlow when only that is installed
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+
+                Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(
+            model_path=model_path, num_threads=num_threads
+        )
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size, height, width, channels = self.input_details["shape"]
+        self.allocate(height, width, channels)
+
+    def quantize_input(self, batch):
+        dtype = self.input_details["dtype"]
+        if dtype == np.float32:
+            return batch
+        scale, zero_point = self.input_details["quantization"]
+        info = np.iinfo(dtype)
+        batch = np.round(batch / scale + zero_point)
+        return np.clip(batch, info.min, info.max).astype(dtype)
+
+    def dequantize_output(self, output):
+        if self.output_details["dtype"] == np.float32:
+            return output
+        scale, zero_point = self.output_details["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def run(self, batch):
+        if batch.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(
+                self.input_details["index"], batch.shape
+            )
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch.shape[0]
+        self.interpreter.set_tensor(
+            self.input_details["index"], self.quantize_input(batch)
+        )
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_details["index"])
+        return self.dequantize_output(output)[:, 0]
+
+
+class OnnxBackend(Backend):
+    name = "onnx"
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        _, height, width, channels = model_input.shape
+        self.allocate(height, width, channels)
+
+    def run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0][:, 0]
+
+
+BACKENDS = {
+    ".h5": KerasBackend,
+    ".keras": KerasBackend,
+    ".tflite": TFLiteBackend,
+    ".onnx": OnnxBackend,
+}
+
+
+def load_backend(model_path):
+    extension = os.path.splitext(model_path)[1].lower()
+    if extension not in BACKENDS:
+        raise ValueError(
+            f"Unsupported model format '{extension}' for {model_path}; "
+            f"expected one of {', '.join(sorted(BACKENDS))}"
+        )
+    return BACKENDS[extension](model_path)
@@ -0,0 +1,346 @@
+import argparse
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from pipeline import Histogram
+
+# Shared inference over a local socket. One server process loads the model
+# once; every notifier started with INFERENCE_SERVER set sends its
+# preprocessed frames there instead of loading its own copy. Frames that
+# arrive within `batch_window` of each other are scored in one forward pass.
+# Frames travel as the uint8 RGB crop at the model's input size, a quarter
+# of the float32 input, and are normalized to 0-1 on the server.
+#
+# Wire format (network byte order):
+#   server -> client on connect   height, width, channels      "!III"
+#   client -> server on connect   name length + UTF-8 name      "!H" + bytes
+#   client -> server per frame    request id + uint8 RGB HWC    "!I" + bytes
+#   server -> client per frame    request id + score            "!If"
+#
+# Addresses are "host:port" for TCP or "unix:/path/to/socket".
+
+HELLO = struct.Struct("!III")
+NAME = struct.Struct("!H")
+REQUEST = struct.Struct("!I")
+RESPONSE = struct.Struct("!If")
+
+
+def parse_address(address):
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:") :]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def recv_exactly(sock, size, out=None):
+    # Read exactly `size` bytes, into `out` when given. Raises
+    # ConnectionError if the peer closes the connection first.
+    buffer = out if out is not None else bytearray(size)
+    view = memoryview(buffer).cast("B")
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise ConnectionError("connection closed")
+        received += count
+    return buffer
+
+
+class InferenceServer:
+    def __init__(self, model, address, batch_window=0.005, max_batch=None):
+        self.model = model
+        self.family, self.address = parse_address(address)
+        self.batch_window = batch_window
+        self.max_batch = max_batch or model.max_batch_size
+        width, height = model.input_size
+        self.shape = (height, width, 3)
+        self.frame_bytes = height * width * 3
+
+        self.requests = queue.Queue()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.queue_delay = Histogram()
+        self.client_latency = {}
+        self.clients = 0
+
+    def start(self):
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.address)
+        self.listener.listen()
+        self.listener.settimeout(0.5)
+        for target, name in (
+            (self.accept_loop, "accept"),
+            (self.batch_loop, "batcher"),
+        ):
+            threading.Thread(target=target, name=name, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.listener.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def accept_loop(self):
+        while not self.stopping.is_set():
+            try:
+                conn, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(
+                target=self.client_loop, args=(conn,), daemon=True
+            ).start()
+
+    def client_loop(self, conn):
+        if self.family == socket.AF_INET:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send_lock = threading.Lock()
+        name = None
+        try:
+            conn.sendall(HELLO.pack(self.shape[0], self.shape[1], 3))
+            (length,) = NAME.unpack(recv_exactly(conn, NAME.size))
+            name = recv_exactly(conn, length).decode() or f"client{id(conn)}"
+            with self.lock:
+                self.clients += 1
+                self.client_latency.setdefault(name, Histogram())
+            print(f"Inference client connected: {name}")
+
+            while not self.stopping.is_set():
+                (request_id,) = REQUEST.unpack(
+                    recv_exactly(conn, REQUEST.size)
+                )
+                pixels = recv_exactly(conn, self.frame_bytes)
+                frame = np.multiply(
+                    np.frombuffer(pixels, np.uint8).reshape(self.shape),
+                    1.0 / 255.0,
+                    dtype=np.float32,
+                )
+                self.requests.put(
+                    (
+                        conn,
+                        send_lock,
+                        name,
+                        request_id,
+                        frame,
+                        time.monotonic(),
+                    )
+                )
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+            if name is not None:
+                with self.lock:
+                    self.clients -= 1
+                print(f"Inference client disconnected: {name}")
+
+    def batch_loop(self):
+        while not self.stopping.is_set():
+            try:
+                batch = [self.requests.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            # Wait up to batch_window for more frames to share the pass
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            started = time.monotonic()
+            try:
+                scores = self.model.predict_batch(
+                    [request[4] for request in batch]
+                )
+            except Exception as e:
+                print(f"Inference failed for a batch of {len(batch)}: {e}")
+                scores = [float("nan")] * len(batch)
+            finished = time.monotonic()
+
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+            for (conn, send_lock, name, request_id, _, received), score in zip(
+                batch, scores
+            ):
+                self.queue_delay.record(started - received)
+                self.client_latency[name].record(finished - received)
+                try:
+                    with send_lock:
+                        conn.sendall(RESPONSE.pack(request_id, float(score)))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            sizes = sorted(self.batch_sizes.items())
+            clients = self.clients
+        batches = sum(count for _, count in sizes)
+        frames = sum(size * count for size, count in sizes)
+        distribution = " ".join(f"{size}:{count}" for size, count in sizes)
+        lines = [
+            f"Inference server: {clients} clients, {frames} frames in "
+            f"{batches} batches (size:count {distribution or '-'})",
+            f"  queueing   {self.queue_delay.summary()}",
+        ]
+        lines += [
+            f"  {name:<10} {histogram.summary()}"
+            for name, histogram in sorted(self.client_latency.items())
+        ]
+        return "\n".join(lines)
+
+
+class RemoteBackend:
+    # Client side: the same interface as an inference backend, scoring
+    # frames on an InferenceServer. Connects on the first frame rather than
+    # at construction, so the notifier starts even while the server is
+    # down; until it is reachable each frame fails on its own, with connect
+    # attempts at most every `retry_interval` seconds. `input_size` has to
+    # match the served model's (the server's hello is checked against it).
+
+    name = "remote"
+
+    def __init__(
+        self,
+        address,
+        client_name=None,
+        timeout=5.0,
+        input_size=(224, 224),
+        retry_interval=5.0,
+    ):
+        self.family, self.address = parse_address(address)
+        self.client_name = (
+            client_name or f"{socket.gethostname()}:{os.getpid()}"
+        )
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.sock = None
+        self.next_connect = 0.0
+        self.request_id = 0
+        self.latency = Histogram()
+        self.input_size = tuple(input_size)
+        width, height = self.input_size
+        self.shape = (height, width, 3)
+        self.frame = np.zeros(self.shape, dtype=np.float32)
+        self.scaled = np.empty(self.shape, dtype=np.float32)
+        self.pixels = np.empty(self.shape, dtype=np.uint8)
+
+    def connect(self):
+        now = time.monotonic()
+        if now < self.next_connect:
+            raise ConnectionError("inference server unavailable")
+        self.next_connect = now + self.retry_interval
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+            if self.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            height, width, channels = HELLO.unpack(
+                recv_exactly(sock, HELLO.size)
+            )
+            if (height, width, channels) != self.shape:
+                raise ConnectionError(
+                    f"inference server expects {width}x{height}x{channels} "
+                    f"frames, not {self.shape[1]}x{self.shape[0]}x3"
+                )
+            name = self.client_name.encode()
+            sock.sendall(NAME.pack(len(name)) + name)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def predict_one(self, img):
+        if self.sock is None:
+            self.connect()
+        start = time.monotonic()
+        self.request_id = (self.request_id + 1) & 0xFFFFFFFF
+        try:
+            self.sock.sendall(REQUEST.pack(self.request_id))
+            # Back to the uint8 pixels the 0-1 input was made from
+            np.multiply(img, 255.0, out=self.scaled)
+            np.rint(self.scaled, out=self.scaled)
+            np.copyto(self.pixels, self.scaled, casting="unsafe")
+            self.sock.sendall(self.pixels)
+            request_id, score = RESPONSE.unpack(
+                recv_exactly(self.sock, RESPONSE.size)
+            )
+        except OSError:
+            self.close()
+            raise
+        if request_id != self.request_id:
+            self.close()
+            raise ConnectionError("inference server answered out of order")
+        self.latency.record(time.monotonic() - start)
+        return score
+
+    def predict_batch(self, images):
+        return np.array([self.predict_one(img) for img in images])
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def stats(self):
+        return f"Remote inference: {self.latency.summary()}"
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from inference import load_backend
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Serve queue pop detection to several notifiers"
+    )
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH"))
+    parser.add_argument(
+        "--listen",
+        default=os.environ.get("INFERENCE_SERVER", "127.0.0.1:8766"),
+        help="host:port or unix:/path",
+    )
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=None)
+    parser.add_argument("--stats-seconds", type=float, default=60.0)
+    args = parser.parse_args()
+    if not args.model:
+        parser.error("--model or MODEL_PATH is required")
+
+    server = InferenceServer(
+        load_backend(args.model),
+        args.listen,
+        batch_window=args.batch_window_ms / 1000,
+        max_batch=args.max_batch,
+    ).start()
+    print(f"Serving {args.model} on {args.listen}")
+    try:
+        while True:
+            time.sleep(args.stats_seconds)
+            print(server.stats())
+    except KeyboardInterrupt:
+        print(server.stats())
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Metrics for the running notifier. Components keep their own counters (as
+# they do for their stats() lines); collectors registered with Metrics turn
+# them into samples when the endpoint is scraped or a dump is written, so
+# nothing is added to the per-frame path beyond what is already counted.
+#
+#   MetricsServer    Prometheus text format on http://127.0.0.1:<port>/metrics
+#   MetricsDumper    the same samples as JSON lines every `interval` seconds
+#   SamplingProfiler wall-clock stack samples of every thread for a while,
+#                    written in collapsed-stack format (flamegraph.pl,
+#                    speedscope); started by SIGUSR1 or GET /profile
+
+Sample = namedtuple("Sample", ["name", "kind", "help", "labels", "value"])
+
+
+def counter(name, help, value, **labels):
+    return Sample(name, "counter", help, labels, value)
+
+
+def gauge(name, help, value, **labels):
+    return Sample(name, "gauge", help, labels, value)
+
+
+def histogram(name, help, bounds, counts, total, **labels):
+    # Samples for a fixed-bucket histogram; `counts` has one entry per bound
+    # plus the overflow bucket, not cumulative
+    samples = []
+    cumulative = 0
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        samples.append(
+            Sample(
+                f"{name}_bucket",
+                "histogram",
+                help,
+                dict(labels, le=f"{bound:g}"),
+                cumulative,
+            )
+        )
+    cumulative += counts[-1]
+    samples += [
+        Sample(
+            f"{name}_bucket",
+            "histogram",
+            help,
+            dict(labels, le="+Inf"),
+            cumulative,
+        ),
+        Sample(f"{name}_sum", "histogram", help, labels, total),
+        Sample(f"{name}_count", "histogram", help, labels, cumulative),
+    ]
+    return samples
+
+
+def summary(name, help, total, count, **labels):
+    return [
+        Sample(f"{name}_sum", "summary", help, labels, total),
+        Sample(f"{name}_count", "summary", help, labels, count),
+    ]
+
+
+def latency_histogram(name, help, latency, **labels):
+    # pipeline.Histogram, which buckets in milliseconds, in seconds
+    return histogram(
+        name,
+        help,
+        [bound / 1000 for bound in latency.bounds],
+        latency.counts,
+        latency.total / 1000,
+        **labels,
+    )
+
+
+class ScoreHistogram:
+    # Distribution of model scores; the buckets are finer near 1 where the
+    # pop threshold usually sits
+
+    bounds = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+
+    def record(self, score):
+        index = sum(score > bound for bound in self.bounds)
+        self.counts[index] += 1
+        self.total += score
+
+    def samples(self, name, help, **labels):
+        return histogram(
+            name, help, self.bounds, self.counts, self.total, **labels
+        )
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_bytes():
+    # Current resident set size: /proc on Linux, psutil where it is
+    # installed, otherwise the peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        peak = peak_rss_mb()
+        return peak * 1024 * 1024 if peak is not None else None
+    return psutil.Process().memory_info().rss
+
+
+def process_samples():
+    samples = [
+        counter(
+            "process_cpu_seconds_total",
+            "User and system CPU time",
+            time.process_time(),
+        ),
+        gauge(
+            "process_threads", "Live Python threads", threading.active_count()
+        ),
+    ]
+    rss = rss_bytes()
+    if rss is not None:
+        samples.append(
+            gauge("process_resident_memory_bytes", "Resident set size", rss)
+        )
+    peak = peak_rss_mb()
+    if peak is not None:
+        samples.append(
+            gauge(
+                "process_peak_resident_memory_bytes",
+                "Peak resident set size",
+                peak * 1024 * 1024,
+            )
+        )
+    return samples
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self.collectors = [process_samples]
+        self.errors = 0
+
+    def register(self, collector):
+        # `collector()` returns an iterable of Samples; it runs on the
+        # endpoint's or dumper's thread, so it should only read counters
+        self.collectors.append(collector)
+        return collector
+
+    def collect(self):
+        samples = []
+        for collector in self.collectors:
+            try:
+                samples += collector()
+            except Exception as e:
+                self.errors += 1
+                print(f"Metrics collector {collector.__name__} failed: {e}")
+        return samples
+
+    def render(self):
+        # Prometheus text exposition format, grouped by metric family
+        families = {}
+        for sample in self.collect():
+            family = sample.name
+            if sample.kind in ("histogram", "summary"):
+                family = family.rsplit("_", 1)[0]
+            families.setdefault(family, []).append(sample)
+        lines = []
+        for family, samples in families.items():
+            lines.append(f"# HELP {family} {samples[0].help}")
+            lines.append(f"# TYPE {family} {samples[0].kind}")
+            lines += [
+                f"{sample.name}{format_labels(sample.labels)} "
+                f"{float(sample.value)!r}"
+                for sample in samples
+            ]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        # Flat {"name{labels}": value} view for the JSON dumps
+        return {
+            f"{sample.name}{format_labels(sample.labels)}": sample.value
+            for sample in self.collect()
+        }
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+    profiler = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ("/", "/metrics"):
+            self.reply(200, self.metrics.render(), "text/plain; version=0.0.4")
+        elif url.path == "/profile" and self.profiler is not None:
+            seconds = parse_qs(url.query).get("seconds")
+            started = self.profiler.start(
+                float(seconds[0]) if seconds else None
+            )
+            self.reply(
+                202 if started else 409,
+                "profiling\n" if started else "already profiling\n",
+            )
+        else:
+            self.reply(404, "not found\n")
+
+    def reply(self, status, body, content_type="text/plain"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    # Only listens on localhost; the metrics and profiles are not meant to
+    # be reachable from the LAN
+
+    def __init__(self, metrics, port, host="127.0.0.1", profiler=None):
+        handler = type(
+            "Handler",
+            (MetricsHandler,),
+            {"metrics": metrics, "profiler": profiler},
+        )
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics", daemon=True
+        )
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsDumper:
+    # Appends a timestamped snapshot to `path` every `interval` seconds
+
+    def __init__(self, metrics, path, interval=60.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.worker, name="metrics-dump", daemon=True
+        )
+        self.thread.start()
+
+    def dump(self):
+        record = {"time": time.time(), **self.metrics.snapshot()}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def worker(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.dump()
+            except OSError as e:
+                print(f"Metrics dump to {self.path} failed: {e}")
+
+    def close(self):
+        self.stopping.set()
+        self.thread.join(self.interval)
+        try:
+            self.dump()
+        except OSError:
+            pass
+
+
+class SamplingProfiler:
+    # Samples the stack of every other thread every `interval` seconds for
+    # `seconds`, then writes one "thread;file:function;... count" line per
+    # distinct stack to `directory`. Samples are wall-clock, so threads
+    # blocked in a wait show up too; look at the capture, preprocess,
+    # inference and main threads for the hot loop.
+
+    def __init__(self, directory="profiles", seconds=30.0, interval=0.005):
+        self.directory = directory
+        self.seconds = seconds
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.profiles = 0
+        self.last_path = None
+
+    def install(self, signum=None):
+        # Start a profile on SIGUSR1 (where the platform has it). Has to be
+        # called from the main thread.
+        signum = signum or getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            return False
+        signal.signal(signum, lambda *_: self.start())
+        return True
+
+    def start(self, seconds=None):
+        # Returns False if a profile is already being taken
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.thread = threading.Thread(
+                target=self.run,
+                args=(seconds or self.seconds,),
+                name="profiler",
+                daemon=True,
+            )
+            self.thread.start()
+            return True
+
+    def run(self, seconds):
+        own = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        print(f"Profiling all threads for {seconds:g}s")
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                calls = []
+                while frame is not None:
+                    code = frame.f_code
+                    calls.append(
+                        f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                    )
+                    frame = frame.f_back
+                calls.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(calls))] += 1
+            samples += 1
+            time.sleep(self.interval)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory,
+            f"profile_{time.strftime('%Y-%m-%d_%H-%M-%S')}.txt",
+        )
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.profiles += 1
+        self.last_path = path
+        print(f"Profile of {samples} samples written to {path}")
@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+
+
+class SendAbandoned(Exception):
+    # A send overran the channel timeout and was left running
+    pass
+
+
+class Channel:
+    # A notification channel with its own worker thread and bounded queue, so
+    # a slow or hung channel never blocks detection or the other channels.
+    #
+    # `send` is given a deadline of `send_share` of the channel timeout so it
+    # can give up cleanly before the channel does. A send that still runs
+    # past the channel timeout is never retried or overlapped by another
+    # send, since it may yet deliver.
+
+    send_share = 0.8
+
+    def __init__(
+        self, name, send, timeout=10.0, retries=2, retry_delay=1.0, size=4
+    ):
+        self.name = name
+        self.send = send
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue(maxsize=size)
+        self.sender = None
+
+        self.sent = 0
+        self.failed = 0
+        self.abandoned = 0
+        self.dropped = 0
+        self.latencies = []
+
+        self.thread = threading.Thread(
+            target=self.worker, name=f"notify-{name}", daemon=True
+        )
+        self.thread.start()
+
+    def put(self, payload):
+        item = (payload, time.monotonic())
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Keep the newest notification; a stale one is useless
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(item)
+
+    def attempt(self, payload):
+        # Run one send in a helper thread so the timeout holds even when the
+        # underlying library blocks without one. A timed out send is
+        # abandoned rather than killed.
+        if self.sender is not None and self.sender.is_alive():
+            # An abandoned send is still running; give it one more timeout
+            # to finish before starting another
+            self.sender.join(self.timeout)
+            if self.sender.is_alive():
+                raise SendAbandoned("previous send is still running")
+        errors = []
+
+        def target():
+            try:
+                self.send(payload, self.timeout * self.send_share)
+            except Exception as e:
+                errors.append(e)
+
+        self.sender = threading.Thread(
+            target=target, name=f"notify-{self.name}-send", daemon=True
+        )
+        self.sender.start()
+        self.sender.join(self.timeout)
+        if self.sender.is_alive():
+            raise SendAbandoned(f"timed out after {self.timeout:g}s")
+        if errors:
+            raise errors[0]
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            payload, queued_at = item
+
+            for attempt in range(self.retries + 1):
+                try:
+                    self.attempt(payload)
+                except SendAbandoned as e:
+                    # Retrying could deliver the notification twice
+                    print(f"{self.name} notification abandoned: {e}")
+                    self.abandoned += 1
+                    break
+                except Exception as e:
+                    print(
+                        f"{self.name} notification failed "
+                        f"(attempt {attempt + 1}/{self.retries + 1}): {e}"
+                    )
+                    if attempt < self.retries:
+                        time.sleep(self.retry_delay * 2**attempt)
+                    continue
+
+                latency = time.monotonic() - queued_at
+                self.sent += 1
+                self.latencies.append(latency)
+                print(f"{self.name} notification sent in {latency:.2f}s")
+                break
+            else:
+                self.failed += 1
+
+    def stop(self, timeout=None):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+    def stats(self):
+        if self.latencies:
+            latency = (
+                f"avg {sum(self.latencies) / len(self.latencies):.2f}s, "
+                f"max {max(self.latencies):.2f}s"
+            )
+        else:
+            latency = "no deliveries"
+        return (
+            f"{self.name}: {self.sent} sent, {self.failed} failed, "
+            f"{self.abandoned} abandoned, {self.dropped} dropped ({latency})"
+        )
+
+
+class NotificationDispatcher:
+    def __init__(self):
+        self.channels = {}
+
+    def add_channel(self, name, send, **options):
+        # `send(payload, timeout)` delivers one notification and raises on
+        # failure
+        self.channels[name] = Channel(name, send, **options)
+
+    def notify(self, name, payload):
+        self.channels[name].put(payload)
+
+    def stop(self, timeout=5.0):
+        for channel in self.channels.values():
+            channel.stop(timeout)
+
+    def stats(self):
+        return "\n".join(channel.stats() for channel in self.channels.values())
@@ -0,0 +1,294 @@
+import bisect
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from inference import preprocess
+
+# Result of running one captured frame through the detector
+FrameResult = namedtuple(
+    "FrameResult",
+    [
+        "seq",
+        "captured_at",
+        "frame",
+        "score",
+        "classified",
+        "changed",
+        "popped",
+    ],
+)
+
+
+class Histogram:
+    # Fixed-bucket latency histogram in milliseconds
+
+    bounds = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.values = []
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total += ms
+        self.values.append(ms)
+        # Keep percentiles cheap on long runs
+        if len(self.values) > 10000:
+            del self.values[:5000]
+
+    def summary(self):
+        if not self.values:
+            return "no samples"
+        p50, p95 = np.percentile(self.values, [50, 95])
+        labels = [f"<={bound}" for bound in self.bounds]
+        labels.append(f">{self.bounds[-1]}")
+        buckets = " ".join(
+            f"{label}:{count}"
+            for label, count in zip(labels, self.counts)
+            if count
+        )
+        return (
+            f"n={sum(self.counts)} p50 {p50:.1f}ms p95 {p95:.1f}ms "
+            f"max {max(self.values):.1f}ms [{buckets}]"
+        )
+
+
+class StageTimings:
+    def __init__(self, stages):
+        self.histograms = {stage: Histogram() for stage in stages}
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+
+    def summary(self):
+        return "\n".join(
+            f"  {stage:<10} {histogram.summary()}"
+            for stage, histogram in self.histograms.items()
+        )
+
+
+class LatestSlot:
+    # Single-item handoff between stages. A new item replaces one that
+    # hasn't been picked up yet, so a slow consumer always gets the newest
+    # frame instead of working through a backlog of stale ones.
+
+    def __init__(self, on_drop=None):
+        self.condition = threading.Condition()
+        self.item = None
+        self.dropped = 0
+        self.on_drop = on_drop
+
+    def put(self, item, replace=True):
+        # Returns False if the item was discarded because the slot was full
+        # and `replace` is False
+        with self.condition:
+            if self.item is not None:
+                if not replace:
+                    return False
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(self.item)
+            self.item = item
+            self.condition.notify()
+        return True
+
+    def get(self, timeout=None):
+        with self.condition:
+            if self.item is None:
+                self.condition.wait(timeout)
+            item, self.item = self.item, None
+            return item
+
+
+class FrameProcessor:
+    # The detection path for a single frame, split into stages so it can run
+    # serially or be spread over the threads of a Pipeline:
+    #   gate        cheap change check (frame_gate.FrameGate)
+    #   preprocess  crop/resize/normalize for the model
+    #   infer       model score
+    #   decide      temporal decision (decision.PopDecider)
+
+    def __init__(self, model, frame_gate, decider, on_result=None):
+        self.model = model
+        self.frame_gate = frame_gate
+        self.decider = decider
+        self.on_result = on_result
+        self.score = None
+        self.timings = StageTimings(
+            ["capture", "gate", "preprocess", "inference", "end_to_end"]
+        )
+
+    def gate(self, frame):
+        start = time.perf_counter()
+        classify = self.frame_gate.should_classify(frame)
+        self.timings.record("gate", time.perf_counter() - start)
+        return classify, self.frame_gate.changed
+
+    def preprocess(self, frame, out=None):
+        start = time.perf_counter()
+        img = preprocess(frame, self.model.input_size, out=out)
+        self.timings.record("preprocess", time.perf_counter() - start)
+        return img
+
+    def infer(self, img):
+        start = time.perf_counter()
+        score = self.model.predict_one(img)
+        self.timings.record("inference", time.perf_counter() - start)
+        return score
+
+    def decide(self, seq, captured_at, frame, score, classified, changed):
+        # Frames skipped by the gate keep the previous score
+        if classified:
+            self.score = score
+        popped = self.score is not None and self.decider.update(
+            self.score, captured_at
+        )
+        result = FrameResult(
+            seq, captured_at, frame, self.score, classified, changed, popped
+        )
+        self.timings.record("end_to_end", self.decider.clock() - captured_at)
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def process(self, frame, seq=0, captured_at=None):
+        # Run all stages on one frame in the calling thread
+        if captured_at is None:
+            captured_at = self.decider.clock()
+        classify, changed = self.gate(frame)
+        score = None
+        if classify:
+            score = self.infer(self.preprocess(frame, out=self.model.frame))
+        return self.decide(seq, captured_at, frame, score, classify, changed)
+
+
+class Pipeline:
+    # Runs capture, preprocessing and inference on their own threads so
+    # inference on one frame overlaps capture of the next. Stages hand off
+    # through LatestSlots, dropping stale frames instead of queueing them.
+    # Preprocessed frames are written into a small pool of reusable buffers.
+
+    def __init__(self, processor, capture_factory, scheduler):
+        # capture_factory is called on the capture thread, since mss handles
+        # are tied to the thread that created them
+        self.processor = processor
+        self.capture_factory = capture_factory
+        self.scheduler = scheduler
+
+        width, height = processor.model.input_size
+        self.buffers = queue.Queue()
+        for _ in range(3):
+            self.buffers.put(np.empty((height, width, 3), dtype=np.float32))
+
+        self.captured = LatestSlot()
+        self.prepared = LatestSlot(on_drop=self.release)
+        self.stopping = threading.Event()
+        self.errors = 0
+        self.threads = [
+            threading.Thread(target=target, name=name, daemon=True)
+            for name, target in (
+                ("capture", self.capture_worker),
+                ("preprocess", self.preprocess_worker),
+                ("inference", self.inference_worker),
+            )
+        ]
+
+    def release(self, item):
+        buffer = item[3]
+        if buffer is not None:
+            self.buffers.put(buffer)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def is_alive(self):
+        return all(thread.is_alive() for thread in self.threads)
+
+    def stop(self, timeout=2.0):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def report_error(self, stage, e):
+        self.errors += 1
+        print(f"Exception in {stage} stage: {e}")
+
+    def capture_worker(self):
+        capture = self.capture_factory()
+        seq = 0
+        try:
+            while not self.stopping.is_set():
+                try:
+                    start = time.perf_counter()
+                    frame = capture.grab()
+                    captured_at = self.processor.decider.clock()
+                    self.processor.timings.record(
+                        "capture", time.perf_counter() - start
+                    )
+                    seq += 1
+                    self.captured.put((seq, captured_at, frame))
+                except Exception as e:
+                    self.report_error("capture", e)
+                self.scheduler.wait()
+        finally:
+            capture.close()
+
+    def preprocess_worker(self):
+        while not self.stopping.is_set():
+            item = self.captured.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, captured_at, frame = item
+            try:
+                classify, changed = self.processor.gate(frame)
+                if not classify:
+                    # Nothing to infer; only pass it on if the inference
+                    # stage has no newer classified frame waiting
+                    self.prepared.put(
+                        (seq, captured_at, frame, None, changed),
+                        replace=False,
+                    )
+                    continue
+                buffer = self.buffers.get()
+                try:
+                    self.processor.preprocess(frame, out=buffer)
+                except Exception:
+                    self.buffers.put(buffer)
+                    raise
+                self.prepared.put((seq, captured_at, frame, buffer, changed))
+            except Exception as e:
+                self.report_error("preprocess", e)
+
+    def inference_worker(self):
+        while not self.stopping.is_set():
+            item = self.prepared.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, captured_at, frame, buffer, changed = item
+            try:
+                score = None
+                if buffer is not None:
+                    try:
+                        score = self.processor.infer(buffer)
+                    finally:
+                        self.release(item)
+                self.processor.decide(
+                    seq, captured_at, frame, score, buffer is not None, changed
+                )
+            except Exception as e:
+                self.report_error("inference", e)
+
+    def stats(self):
+        return (
+            f"Pipeline: {self.captured.dropped} captured frames dropped, "
+            f"{self.prepared.dropped} preprocessed frames dropped, "
+            f"{self.errors} errors"
+        )
@@ -1,12 +1,27 @@
+import os
+import shutil
+
+import cv2
 import tensorflow as tf
+from dotenv import load_dotenv
 
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Flatten, Dense, Dropout
+from tensorflow.keras.layers import Input
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
 
-from tensorflow.keras.applications import VGG16
+from architectures import build_model
+from bottleneck import (
+    FeatureStore,
+    base_signature,
+    extract_features,
+    feature_dataset,
+)
+from capture import crop_roi, parse_roi
+from training_data import ThroughputCallback, list_image_files, make_dataset
+
+load_dotenv()
 
 # Set GPU memory growth to limit GPU usage to 80%
 gpus = tf.config.experimental.list_physical_devices("GPU")
@@ -25,63 +40,222 @@ if gpus:
     except RuntimeError as e:
         print(e)
 
-# Define the data augmentation parameters
-train_datagen = ImageDataGenerator(
-    rescale=1.0 / 255,
-    rotation_range=10,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    shear_range=0.1,
-    zoom_range=0.1,
-    horizontal_flip=True,
-    fill_mode="nearest",
-)
 
-val_datagen = ImageDataGenerator(rescale=1.0 / 255)
+def prepare_roi_dataset(src_dir, dst_dir, roi):
+    # Write ROI-cropped copies of every image under src_dir/<label>/ into
+    # dst_dir/<label>/. Images already cropped with the same ROI are kept, so
+    # only new screenshots are processed on later runs. Cached copies whose
+    # source was moved or deleted (rebalancing, relabeling, dedupe) are
+    # removed, so the cache never holds an image under two splits or labels.
+    roi_key = ",".join(str(value) for value in roi)
+    marker_path = os.path.join(dst_dir, ".roi")
+    if os.path.exists(marker_path):
+        with open(marker_path) as marker:
+            if marker.read() != roi_key:
+                shutil.rmtree(dst_dir)
 
-# Use the ImageDataGenerator to create train and validation generators
-train_generator = train_datagen.flow_from_directory(
-    "train",
-    target_size=(224, 224),
-    batch_size=16,
-    class_mode="binary",
-)
+    labels = [
+        label
+        for label in sorted(os.listdir(src_dir))
+        if os.path.isdir(os.path.join(src_dir, label))
+    ]
+    if os.path.isdir(dst_dir):
+        for label in os.listdir(dst_dir):
+            stale = os.path.join(dst_dir, label)
+            if label not in labels and os.path.isdir(stale):
+                shutil.rmtree(stale)
 
-val_generator = val_datagen.flow_from_directory(
-    "val",
-    target_size=(224, 224),
-    batch_size=16,
-    class_mode="binary",
-)
+    for label in labels:
+        src_label_dir = os.path.join(src_dir, label)
+        dst_label_dir = os.path.join(dst_dir, label)
+        os.makedirs(dst_label_dir, exist_ok=True)
+
+        src_files = set(os.listdir(src_label_dir))
+        for img_file in os.listdir(dst_label_dir):
+            if img_file not in src_files:
+                os.remove(os.path.join(dst_label_dir, img_file))
+
+        for img_file in src_files:
+            src_path = os.path.join(src_label_dir, img_file)
+            dst_path = os.path.join(dst_label_dir, img_file)
+            if os.path.exists(dst_path) and os.path.getmtime(
+                dst_path
+            ) >= os.path.getmtime(src_path):
+                continue
+            img = cv2.imread(src_path)
+            if img is None:
+                continue
+            cv2.imwrite(dst_path, crop_roi(img, roi))
+
+    with open(marker_path, "w") as marker:
+        marker.write(roi_key)
+    return dst_dir
 
-# Load a pre-trained model for transfer learning
-pretrained_model = VGG16(
-    weights="imagenet", include_top=False, input_shape=(224, 224, 3)
+
+# Train on the same region the notifier captures when CAPTURE_ROI is set.
+# Fractional ROIs are recommended here since saved screenshots may not be at
+# the monitor's native resolution.
+train_dir = "train"
+val_dir = "val"
+roi = parse_roi(os.environ.get("CAPTURE_ROI"))
+if roi is not None:
+    print(f"Cropping training data to ROI {roi}")
+    train_dir = prepare_roi_dataset(
+        train_dir, os.path.join("roi_cache", "train"), roi
+    )
+    val_dir = prepare_roi_dataset(
+        val_dir, os.path.join("roi_cache", "val"), roi
+    )
+
+# MODEL_ARCHITECTURE picks the detector (see architectures.py): "vgg16",
+# "mobilenet_v3_small", "efficientnet_b0" or "tiny_cnn", at INPUT_SIZE pixels
+# square. The trained model is saved to MODEL_OUTPUT; point the notifier's
+# MODEL_PATH at it to use it.
+architecture = os.environ.get("MODEL_ARCHITECTURE", "vgg16")
+input_size = int(os.environ.get("INPUT_SIZE", "224"))
+image_size = (input_size, input_size)
+default_output = (
+    "queue_pop_detector.h5"
+    if architecture == "vgg16" and input_size == 224
+    else f"queue_pop_detector_{architecture}_{input_size}.keras"
 )
+model_output = os.environ.get("MODEL_OUTPUT", default_output)
+epochs = int(os.environ.get("TRAIN_EPOCHS", "100"))
 
-# Freeze the pre-trained layers
-for layer in pretrained_model.layers:
-    layer.trainable = False
-
-# Create a new model with the pre-trained layers and some new layers
-model = Sequential(
-    [
-        pretrained_model,
-        Flatten(),
-        Dense(128, activation="relu"),
-        Dropout(0.5),
-        Dense(1, activation="sigmoid"),
-    ]
+# A frozen pre-trained base (None for tiny_cnn, which trains from scratch)
+# plus new layers. The head layers are kept separately so they can also be
+# trained on their own from cached bottleneck features.
+model, pretrained_model, head_layers, learning_rate = build_model(
+    architecture, input_size
 )
+print(f"Training {architecture} at {input_size}x{input_size}")
 
 # Compile the model
 model.compile(
-    optimizer=Adam(learning_rate=1e-4), loss="binary_crossentropy", metrics=["accuracy"]
+    optimizer=Adam(learning_rate=learning_rate),
+    loss="binary_crossentropy",
+    metrics=["accuracy"],
 )
+fit_model = model
+
+# TRAIN_LOADER selects how images are fed to training: "generator" uses
+# ImageDataGenerator.flow_from_directory, "tf_data" uses a parallel, cached
+# tf.data pipeline with the same augmentation (see training_data.py).
+# TRAIN_CACHE is "memory", "none" or a file path prefix for an on-disk cache.
+# "bottleneck" runs the frozen base once per image and augmentation
+# variant (BOTTLENECK_VARIANTS), caches the features in BOTTLENECK_CACHE and
+# trains only the head from them (see bottleneck.py).
+loader = os.environ.get("TRAIN_LOADER", "generator")
+batch_size = 16
+
+if loader == "tf_data":
+    train_cache = os.environ.get("TRAIN_CACHE", "memory")
+    if train_cache == "none":
+        train_cache = None
+    train_data, train_count = make_dataset(
+        train_dir,
+        image_size=image_size,
+        batch_size=batch_size,
+        augment=True,
+        shuffle=True,
+        cache=train_cache,
+    )
+    val_data, val_count = make_dataset(
+        val_dir,
+        image_size=image_size,
+        batch_size=batch_size,
+        cache=train_cache and f"{train_cache}_val",
+    )
+    steps_per_epoch = validation_steps = None
+    images_per_epoch = train_count
+elif loader == "generator":
+    # Define the data augmentation parameters
+    train_datagen = ImageDataGenerator(
+        rescale=1.0 / 255,
+        rotation_range=10,
+        width_shift_range=0.1,
+        height_shift_range=0.1,
+        shear_range=0.1,
+        zoom_range=0.1,
+        horizontal_flip=True,
+        fill_mode="nearest",
+    )
+
+    val_datagen = ImageDataGenerator(rescale=1.0 / 255)
+
+    # Use the ImageDataGenerator to create train and validation generators
+    train_data = train_datagen.flow_from_directory(
+        train_dir,
+        target_size=image_size,
+        batch_size=batch_size,
+        class_mode="binary",
+    )
+
+    val_data = val_datagen.flow_from_directory(
+        val_dir,
+        target_size=image_size,
+        batch_size=batch_size,
+        class_mode="binary",
+    )
+    steps_per_epoch = train_data.n // batch_size
+    validation_steps = val_data.n // batch_size
+    images_per_epoch = steps_per_epoch * batch_size
+elif loader == "bottleneck":
+    if pretrained_model is None:
+        raise ValueError(
+            f"TRAIN_LOADER=bottleneck needs a pre-trained base; "
+            f"{architecture} has none"
+        )
+    # One cache per base and input size, so switching between them keeps
+    # both; the store also checks the base it was written for
+    store = FeatureStore(
+        os.path.join(
+            os.environ.get("BOTTLENECK_CACHE", "bottleneck_cache"),
+            f"{architecture}_{input_size}",
+        ),
+        base_signature(pretrained_model),
+    )
+    variants = int(os.environ.get("BOTTLENECK_VARIANTS", "5"))
+
+    train_paths, train_labels = list_image_files(train_dir)
+    val_paths, val_labels = list_image_files(val_dir)
+    train_hashes = extract_features(
+        pretrained_model, train_paths, store, variants, image_size
+    )
+    val_hashes = extract_features(
+        pretrained_model, val_paths, store, 1, image_size
+    )
+    train_data, images_per_epoch = feature_dataset(
+        store,
+        train_hashes,
+        train_labels,
+        variants,
+        batch_size=batch_size,
+        shuffle=True,
+    )
+    val_data, _ = feature_dataset(
+        store, val_hashes, val_labels, 1, batch_size=batch_size
+    )
+    steps_per_epoch = validation_steps = None
+
+    # Train a model made of just the (shared) head layers
+    fit_model = Sequential(
+        [Input(pretrained_model.output_shape[1:])] + head_layers
+    )
+    fit_model.compile(
+        optimizer=Adam(learning_rate=learning_rate),
+        loss="binary_crossentropy",
+        metrics=["accuracy"],
+    )
+else:
+    raise ValueError(
+        f"Unknown TRAIN_LOADER '{loader}'; "
+        "expected generator, tf_data or bottleneck"
+    )
 
 
 # Define the path where the model weights will be saved
-checkpoint_filepath = "queue_pop_detector.h5"
+checkpoint_filepath = f"{os.path.splitext(model_output)[0]}.weights.h5"
 
 # Create a ModelCheckpoint callback to save the model weights after each epoch
 checkpoint_callback = ModelCheckpoint(
@@ -97,16 +271,30 @@ try:
         monitor="val_accuracy", patience=5, mode="max", verbose=1
     )
 
-    history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.n // train_generator.batch_size,
-        epochs=100,
-        validation_data=val_generator,
-        validation_steps=val_generator.n // val_generator.batch_size,
-        callbacks=[checkpoint_callback, early_stop],
+    throughput = ThroughputCallback(images_per_epoch, loader)
+
+    # Head-only training finishes in seconds, so skip per-epoch checkpoints
+    callbacks = [early_stop, throughput]
+    if fit_model is model:
+        callbacks.append(checkpoint_callback)
+
+    history = fit_model.fit(
+        train_data,
+        steps_per_epoch=steps_per_epoch,
+        epochs=epochs,
+        validation_data=val_data,
+        validation_steps=validation_steps,
+        callbacks=callbacks,
     )
 except KeyboardInterrupt:
     print("Training interrupted")
 
+if throughput.history:
+    print(
+        f"{loader} loader: {sum(throughput.history) / len(throughput.history):.1f} "
+        f"images/sec on average over {len(throughput.history)} epochs"
+    )
+
 # Save the model
-model.save("queue_pop_detector.h5")
+model.save(model_output)
+print(f"Saved {architecture} model to {model_output}")
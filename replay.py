@@ -0,0 +1,271 @@
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import cv2
+
+from dataset_index import IMAGE_EXTENSIONS
+from detection import (
+    decider_from_env,
+    detector_from_env,
+    frame_gate_from_env,
+    handle_detection,
+    scheduler_from_env,
+)
+from pipeline import FrameProcessor
+
+# Offline replay of recorded frame sequences through the notifier's
+# detection path (capture -> gate -> preprocess -> infer -> decide), driven
+# by a virtual clock so a sequence runs as fast as the model allows while
+# the frame gate, scheduler and decider see the timing they would have
+# seen live. Notifications go to a fake sink instead of Pushover and the
+# Google Home.
+#
+# A sequence is either
+#   - a directory of screenshots, timed by a "frame_+1.25s" offset in the
+#     file name (the POP_HISTORY_SECONDS dumps), the screenshot_m1.py
+#     timestamp, or else the file's mtime, or
+#   - a video file, timed by its frame timestamps.
+# Pops are labeled in pops.json inside the directory, or <video>.pops.json
+# next to the video, as [[start, end], ...] in seconds from the first
+# frame. Sequences without labels count every notification as a false
+# alarm.
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm")
+
+OFFSET_PATTERN = re.compile(r"frame_([-+]?\d+(?:\.\d+)?)s")
+DATETIME_PATTERN = re.compile(r"\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d_\d{6}")
+
+# Result of replaying one sequence; times are in virtual seconds except
+# cpu_seconds and wall_seconds
+ReplayResult = namedtuple(
+    "ReplayResult",
+    [
+        "name",
+        "duration",
+        "frames",
+        "classified",
+        "pops",
+        "latencies",
+        "false_alarms",
+        "cpu_seconds",
+        "wall_seconds",
+    ],
+)
+
+
+class VirtualClock:
+    # Stands in for time.monotonic and time.sleep; sleeping just moves the
+    # clock forward
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += max(seconds, 0.0)
+
+    sleep = advance
+
+
+class FakeSink:
+    # Takes the place of the NotificationDispatcher and records what would
+    # have been sent, and when
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []
+
+    def notify(self, channel, payload):
+        self.sent.append((self.clock(), channel, payload))
+
+
+def frame_time(path):
+    name = os.path.basename(path)
+    match = OFFSET_PATTERN.search(name)
+    if match:
+        return float(match.group(1))
+    match = DATETIME_PATTERN.search(name)
+    if match:
+        stamp = datetime.strptime(match.group(0), "%Y-%m-%d_%H-%M-%S_%f")
+        return stamp.timestamp()
+    return os.path.getmtime(path)
+
+
+def load_pops(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [(float(start), float(end)) for start, end in json.load(f)]
+
+
+class ReplayCapture:
+    # Capture stand-in: grab() returns the newest recorded frame at or
+    # before the virtual clock's time, so a slow schedule skips frames just
+    # like it would live. Frames are decoded on demand.
+
+    def __init__(self, path, clock):
+        self.path = path
+        self.clock = clock
+        self.video = None
+        if os.path.isdir(path):
+            files = [
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            timed = sorted((frame_time(file), file) for file in files)
+            if not timed:
+                raise ValueError(f"No frames in {path}")
+            start = timed[0][0]
+            self.frames = [(t - start, file) for t, file in timed]
+            self.duration = self.frames[-1][0]
+            self.pops = load_pops(os.path.join(path, "pops.json"))
+        else:
+            self.video = cv2.VideoCapture(path)
+            if not self.video.isOpened():
+                raise ValueError(f"Could not open video {path}")
+            fps = self.video.get(cv2.CAP_PROP_FPS) or 30.0
+            count = self.video.get(cv2.CAP_PROP_FRAME_COUNT)
+            self.duration = max(count - 1, 0) / fps
+            self.pops = load_pops(os.path.splitext(path)[0] + ".pops.json")
+        self.index = -1
+        self.current = None
+        self.pending = None
+
+    def done(self):
+        return self.clock() > self.duration
+
+    def grab(self):
+        now = self.clock()
+        if self.video is not None:
+            return self.grab_video(now)
+        index = self.index
+        while (
+            index + 1 < len(self.frames) and self.frames[index + 1][0] <= now
+        ):
+            index += 1
+        if index != self.index:
+            self.index = index
+            self.current = cv2.imread(self.frames[index][1], cv2.IMREAD_COLOR)
+            if self.current is None:
+                raise ValueError(f"Could not read {self.frames[index][1]}")
+        return self.current
+
+    def grab_video(self, now):
+        # Decode forward, keeping the last frame that is due; the first
+        # frame past `now` is held for a later grab
+        while True:
+            if self.pending is None:
+                ok, frame = self.video.read()
+                if not ok:
+                    break
+                timestamp = self.video.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                self.pending = (timestamp, frame)
+            if self.pending[0] > now and self.current is not None:
+                break
+            self.current = self.pending[1]
+            self.pending = None
+        return self.current
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+
+
+def find_sequences(paths):
+    # Expand the given paths into sequences: a directory that holds frames
+    # is one sequence, otherwise its subdirectories and videos are
+    sequences = []
+    for path in paths:
+        if path.lower().endswith(VIDEO_EXTENSIONS):
+            sequences.append(path)
+            continue
+        names = sorted(os.listdir(path))
+        if any(name.lower().endswith(IMAGE_EXTENSIONS) for name in names):
+            sequences.append(path)
+            continue
+        for name in names:
+            child = os.path.join(path, name)
+            if os.path.isdir(child) or name.lower().endswith(VIDEO_EXTENSIONS):
+                sequences += find_sequences([child])
+    return sequences
+
+
+def match_notifications(pops, sent, grace=0.0):
+    # Latency from the start of each labeled pop to its first notification
+    # (None if it was missed), and the number of notifications that fall
+    # outside every pop
+    latencies = []
+    matched = set()
+    for start, end in pops:
+        latency = None
+        for i, (sent_at, _, _) in enumerate(sent):
+            if start <= sent_at <= end + grace:
+                matched.add(i)
+                if latency is None:
+                    latency = sent_at - start
+        latencies.append(latency)
+    return latencies, len(sent) - len(matched)
+
+
+def replay(path, model, templates=None, realtime=True, grace=1.0):
+    # Replay one sequence. With `realtime`, the virtual clock also advances
+    # by the wall time each frame took to process, so slow inference delays
+    # detection and stretches the schedule the way it would live.
+    clock = VirtualClock()
+    capture = ReplayCapture(path, clock)
+    # The same components and result handling as wow_queue_notifier.py,
+    # on the virtual clock
+    frame_gate = frame_gate_from_env(clock)
+    decider = decider_from_env(clock)
+    scheduler = scheduler_from_env(clock, clock.sleep)
+    detector = detector_from_env(model, templates)
+    sink = FakeSink(clock)
+
+    def handle_result(result):
+        handle_detection(result, scheduler, sink.notify)
+
+    processor = FrameProcessor(
+        detector, frame_gate, decider, on_result=handle_result
+    )
+    frames = 0
+    classified = 0
+    cpu_seconds = 0.0
+    wall_start = time.perf_counter()
+    try:
+        while not capture.done():
+            captured_at = clock()
+            img = capture.grab()
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            result = processor.process(img, frames, captured_at)
+            elapsed = time.perf_counter() - start
+            cpu_seconds += time.process_time() - cpu_start
+            frames += 1
+            classified += result.classified
+            if realtime:
+                clock.advance(elapsed)
+            scheduler.wait()
+    finally:
+        capture.close()
+
+    # Each pop notifies both channels; count it once
+    pushes = [sent for sent in sink.sent if sent[1] == "pushover"]
+    latencies, false_alarms = match_notifications(capture.pops, pushes, grace)
+    return ReplayResult(
+        os.path.basename(os.path.normpath(path)),
+        capture.duration,
+        frames,
+        classified,
+        len(capture.pops),
+        latencies,
+        false_alarms,
+        cpu_seconds,
+        time.perf_counter() - wall_start,
+    )
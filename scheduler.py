@@ -0,0 +1,127 @@
+import statistics
+import time
+
+
+class FrameScheduler:
+    # Paces the capture loop against monotonic deadlines, so time spent on
+    # capture and inference comes out of the frame period instead of adding
+    # to it, and adapts the period to what is happening on screen:
+    #   fast    for `fast_hold` seconds after the screen changed or the model
+    #           score started rising
+    #   slow    when nothing changed for `idle_after` seconds or the game
+    #           window isn't in the foreground
+    #   normal  otherwise
+    # A frame that takes longer than its period is counted as an overrun and
+    # the schedule restarts from now rather than bursting to catch up.
+
+    def __init__(
+        self,
+        fast_period=0.2,
+        normal_period=1.0,
+        slow_period=4.0,
+        idle_after=30.0,
+        fast_hold=5.0,
+        rise_threshold=0.3,
+        rise_delta=0.2,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.periods = {
+            "fast": fast_period,
+            "normal": normal_period,
+            "slow": slow_period,
+        }
+        self.idle_after = idle_after
+        self.fast_hold = fast_hold
+        self.rise_threshold = rise_threshold
+        self.rise_delta = rise_delta
+        self.clock = clock
+        self.sleep = sleep
+
+        now = clock()
+        self.mode = "normal"
+        self.deadline = None
+        self.last_activity = now
+        self.fast_until = now
+        self.last_score = None
+
+        self.total_frames = 0
+        self.total_overruns = 0
+        self.reset_window(now)
+
+    @property
+    def period(self):
+        return self.periods[self.mode]
+
+    def reset_window(self, now):
+        self.window_start = now
+        self.frames = 0
+        self.overruns = 0
+        self.lateness = []
+        self.mode_frames = {mode: 0 for mode in self.periods}
+
+    def update(self, changed=False, score=None, foreground=True):
+        # Pick the period for the next frame from what the last one showed
+        now = self.clock()
+        rising = score is not None and (
+            score >= self.rise_threshold
+            or (
+                self.last_score is not None
+                and score - self.last_score >= self.rise_delta
+            )
+        )
+        if score is not None:
+            self.last_score = score
+
+        if changed or rising:
+            self.last_activity = now
+            self.fast_until = now + self.fast_hold
+
+        if now < self.fast_until:
+            self.mode = "fast"
+        elif not foreground or now - self.last_activity >= self.idle_after:
+            self.mode = "slow"
+        else:
+            self.mode = "normal"
+
+    def wait(self):
+        # Sleep until the start of the next frame
+        now = self.clock()
+        self.frames += 1
+        self.total_frames += 1
+        self.mode_frames[self.mode] += 1
+
+        if self.deadline is None:
+            self.deadline = now
+        self.deadline += self.period
+        if now >= self.deadline:
+            self.overruns += 1
+            self.total_overruns += 1
+            self.deadline = now
+            return
+
+        self.sleep(self.deadline - now)
+        self.lateness.append(self.clock() - self.deadline)
+
+    def stats(self):
+        # Summarize and reset the current reporting window
+        now = self.clock()
+        elapsed = now - self.window_start
+        fps = self.frames / elapsed if elapsed > 0 else 0.0
+        if self.lateness:
+            mean_ms = statistics.mean(self.lateness) * 1000
+            jitter_ms = statistics.pstdev(self.lateness) * 1000
+            max_ms = max(self.lateness) * 1000
+        else:
+            mean_ms = jitter_ms = max_ms = 0.0
+        modes = ", ".join(
+            f"{mode} {count}" for mode, count in self.mode_frames.items()
+        )
+        summary = (
+            f"Scheduler: {fps:.2f} fps over {elapsed:.0f}s ({modes}), "
+            f"wake-up lateness mean {mean_ms:.1f}ms, jitter {jitter_ms:.1f}ms, "
+            f"max {max_ms:.1f}ms, {self.overruns} overruns "
+            f"({self.total_overruns} total), now {self.mode}"
+        )
+        self.reset_window(now)
+        return summary
@@ -0,0 +1,90 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class ScreenshotWriter:
+    # Encodes and writes images on a background thread so JPEG encoding and
+    # disk I/O never hold up capture. The queue is bounded; when the disk
+    # can't keep up, new images are dropped (and counted) rather than
+    # buffered without limit.
+
+    def __init__(self, quality=90, size=16):
+        self.quality = quality
+        self.queue = queue.Queue(size)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.write_seconds = 0.0
+        self.thread = threading.Thread(
+            target=self.worker, name="screenshot-writer", daemon=True
+        )
+        self.thread.start()
+
+    def save(self, path, img):
+        # Queue a BGR (or BGRA) uint8 image to be written to `path`. The
+        # writer keeps a reference to `img`, so don't modify it afterwards.
+        try:
+            self.queue.put_nowait((path, img))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, img = item
+            start = time.perf_counter()
+            try:
+                if img.ndim == 3 and img.shape[2] == 4:
+                    img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                if not cv2.imwrite(
+                    path, img, [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+                ):
+                    raise OSError(f"could not write {path}")
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Screenshot write failed: {e}")
+            self.write_seconds += time.perf_counter() - start
+
+    def close(self, timeout=5.0):
+        # Write whatever is still queued, then stop the worker
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def stats(self):
+        average_ms = (
+            1000 * self.write_seconds / self.written if self.written else 0.0
+        )
+        return (
+            f"Screenshot writer: {self.written} written "
+            f"({average_ms:.1f}ms each), {self.dropped} dropped, "
+            f"{self.failed} failed"
+        )
+
+
+class FrameHistory:
+    # Ring buffer of the frames captured in the last `seconds`, dumped next
+    # to a pop screenshot so the lead-up can be labeled later. Frames are
+    # kept by reference; capture hands out a new array for every grab.
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.frames = deque()
+
+    def add(self, timestamp, frame):
+        self.frames.append((timestamp, frame))
+        while self.frames and timestamp - self.frames[0][0] > self.seconds:
+            self.frames.popleft()
+
+    def snapshot(self):
+        return list(self.frames)
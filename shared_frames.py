@@ -0,0 +1,340 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from capture import ScreenCapture, parse_roi
+
+# Frame handoff between a capture process and the detection process through
+# shared memory, so the mss grab runs on its own interpreter (and GIL) and
+# frames are never pickled or copied between processes.
+#
+# The block holds a control word array, per-slot sequence numbers and
+# capture times, and `slots` fixed-size uint8 frames. The writer grabs into
+# slot seq % slots, then publishes seq; readers take the latest published
+# frame and can check afterwards that its slot wasn't reused while they were
+# working on it.
+
+# control words
+LATEST, STOP, PERIOD_US = range(3)
+
+
+def _aligned(offset):
+    return (offset + 63) & ~63
+
+
+class SharedFrameRing:
+    def __init__(self, shape, slots=8, name=None):
+        # Creates the shared block, or attaches to `name` when given
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+
+        control_offset = 0
+        seqs_offset = _aligned(control_offset + 8 * 4)
+        times_offset = _aligned(seqs_offset + 8 * slots)
+        frames_offset = _aligned(times_offset + 8 * slots)
+        size = frames_offset + frame_bytes * slots
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Attaching must not make this process an owner of the block;
+            # before Python 3.13 its resource tracker would unlink the block
+            # when this process exits
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                self.shm = shared_memory.SharedMemory(name=name)
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        self.control = np.ndarray((4,), np.int64, buf, control_offset)
+        self.seqs = np.ndarray((slots,), np.int64, buf, seqs_offset)
+        self.times = np.ndarray((slots,), np.float64, buf, times_offset)
+        self.frames = np.ndarray(
+            (slots,) + self.shape, np.uint8, buf, frames_offset
+        )
+        if self.owner:
+            self.control[:] = 0
+            self.seqs[:] = -1
+
+    @property
+    def latest(self):
+        return int(self.control[LATEST])
+
+    @property
+    def period(self):
+        return self.control[PERIOD_US] / 1e6
+
+    @period.setter
+    def period(self, seconds):
+        self.control[PERIOD_US] = int(seconds * 1e6)
+
+    @property
+    def stopping(self):
+        return bool(self.control[STOP])
+
+    def stop(self):
+        self.control[STOP] = 1
+
+    def begin_write(self):
+        # Returns (seq, slot array) for the next frame
+        seq = self.latest + 1
+        slot = seq % self.slots
+        self.seqs[slot] = -1
+        return seq, self.frames[slot]
+
+    def commit(self, seq, captured_at):
+        slot = seq % self.slots
+        self.times[slot] = captured_at
+        self.seqs[slot] = seq
+        self.control[LATEST] = seq
+
+    def read(self, seq):
+        # (captured_at, read-only view) of frame `seq`, or None if its slot
+        # has already been reused
+        slot = seq % self.slots
+        if self.seqs[slot] != seq:
+            return None
+        frame = self.frames[slot]
+        frame.flags.writeable = False
+        return float(self.times[slot]), frame
+
+    def valid(self, seq):
+        return self.seqs[seq % self.slots] == seq
+
+    def close(self):
+        # Views into the block have to go before it can be closed
+        del self.control, self.seqs, self.times, self.frames
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a frame; the mapping goes away with it
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+class SyntheticCapture:
+    # Stand-in for ScreenCapture where there is no screen: copies a fixed
+    # frame after `cost` seconds of Python-level work, which holds the GIL
+    # the way the Python side of a real grab does
+
+    def __init__(self, shape, cost=0.005):
+        self.frame = np.random.default_rng(0).integers(
+            0, 255, shape, dtype=np.uint8
+        )
+        self.cost = cost
+
+    def grab(self, out=None):
+        end = time.perf_counter() + self.cost
+        while time.perf_counter() < end:
+            pass
+        if out is None:
+            return self.frame.copy()
+        np.copyto(out, self.frame)
+        return out
+
+    def close(self):
+        pass
+
+
+def watch_parent(orphaned):
+    # The detection process holds the write end of our stdin; reading it
+    # returns EOF once that process is gone, however it exited
+    try:
+        sys.stdin.buffer.read()
+    except (OSError, ValueError):
+        pass
+    orphaned.set()
+
+
+def capture_main(argv=None):
+    # Capture process: grab into the ring as paced by ring.period (set by
+    # the detection process), using monotonic deadlines. Exits when the
+    # ring is stopped or the detection process goes away.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("name")
+    parser.add_argument("--shape", type=int, nargs=3, required=True)
+    parser.add_argument("--slots", type=int, required=True)
+    parser.add_argument("--monitor", type=int, default=0)
+    parser.add_argument("--roi")
+    parser.add_argument("--synthetic-ms", type=float)
+    args = parser.parse_args(argv)
+
+    ring = SharedFrameRing(args.shape, args.slots, args.name)
+    if args.synthetic_ms is not None:
+        source = SyntheticCapture(ring.shape, args.synthetic_ms / 1000)
+    else:
+        source = ScreenCapture(args.monitor, parse_roi(args.roi))
+    orphaned = threading.Event()
+    threading.Thread(
+        target=watch_parent, args=(orphaned,), name="parent", daemon=True
+    ).start()
+    deadline = time.monotonic()
+    try:
+        while not ring.stopping and not orphaned.is_set():
+            seq, slot = ring.begin_write()
+            source.grab(out=slot)
+            ring.commit(seq, time.monotonic())
+
+            deadline += ring.period
+            now = time.monotonic()
+            if deadline <= now:
+                deadline = now
+            else:
+                time.sleep(deadline - now)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.close()
+        ring.close()
+
+
+class CaptureProcessDied(RuntimeError):
+    pass
+
+
+class SharedFrameSource:
+    # Detection-process side of a capture process. grab() returns the newest
+    # frame as a read-only view into shared memory, valid until the ring
+    # wraps around; copy anything that needs to be kept longer.
+    #
+    # The capture process is started as a plain subprocess of this module
+    # rather than through multiprocessing, whose spawn start method would
+    # re-run the notifier script in the child. If it dies, grab() restarts
+    # it, waiting twice as long after each failed restart (up to
+    # `max_restart_delay`) and raising CaptureProcessDied in between.
+
+    poll_interval = 0.001
+    restart_delay = 1.0
+    max_restart_delay = 60.0
+
+    def __init__(self, shape, source_args, slots=8, period=1.0):
+        self.ring = SharedFrameRing(shape, slots)
+        self.ring.period = period
+        self.command = [
+            sys.executable,
+            os.path.abspath(__file__),
+            self.ring.name,
+            "--shape",
+            *(str(value) for value in self.ring.shape),
+            "--slots",
+            str(slots),
+            *source_args,
+        ]
+        self.start_process()
+        self.delay = self.restart_delay
+        self.next_restart = 0.0
+        self.restarts = 0
+
+        self.seq = 0
+        self.captured_at = None
+        self.frames = 0
+        self.skipped = 0
+        self.overwritten = 0
+
+    @classmethod
+    def for_screen(cls, monitor_index=0, roi=None, **options):
+        # Size the ring from a real grab, which is larger than the region
+        # on HiDPI displays
+        with ScreenCapture(monitor_index, roi) as probe:
+            shape = probe.shape
+        source_args = ["--monitor", str(monitor_index)]
+        if roi is not None:
+            source_args += ["--roi", ",".join(str(value) for value in roi)]
+        return cls(shape, source_args, **options)
+
+    @classmethod
+    def synthetic(cls, shape, capture_ms=5.0, **options):
+        return cls(shape, ["--synthetic-ms", str(capture_ms)], **options)
+
+    def start_process(self):
+        # The child watches its stdin to notice when this process is gone
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE)
+
+    def restart(self):
+        now = time.monotonic()
+        if now < self.next_restart:
+            raise CaptureProcessDied(
+                f"capture process exited with {self.process.returncode}; "
+                f"restarting in {self.next_restart - now:.1f}s"
+            )
+        self.process.stdin.close()
+        print(
+            f"Capture process exited with {self.process.returncode}; "
+            "restarting it"
+        )
+        self.start_process()
+        self.restarts += 1
+        self.next_restart = now + self.delay
+        self.delay = min(self.delay * 2, self.max_restart_delay)
+
+    @property
+    def period(self):
+        return self.ring.period
+
+    @period.setter
+    def period(self, seconds):
+        self.ring.period = seconds
+
+    def grab(self, timeout=5.0):
+        # Wait for a frame newer than the last one returned, polling the
+        # shared sequence counter
+        if self.seq and not self.ring.valid(self.seq):
+            # The previous frame was overwritten while it was in use; more
+            # slots are needed for this capture rate
+            self.overwritten += 1
+        if self.process.poll() is not None:
+            self.restart()
+        deadline = time.monotonic() + timeout
+        while True:
+            latest = self.ring.latest
+            if latest > self.seq:
+                frame = self.ring.read(latest)
+                if frame is not None:
+                    break
+            if self.process.poll() is not None:
+                raise CaptureProcessDied(
+                    f"capture process exited with {self.process.returncode}"
+                )
+            if time.monotonic() >= deadline:
+                raise TimeoutError("no frame from the capture process")
+            time.sleep(self.poll_interval)
+        # Frames are flowing again; the next failure restarts promptly
+        self.delay = self.restart_delay
+
+        if self.seq:
+            self.skipped += latest - self.seq - 1
+        self.seq = latest
+        self.frames += 1
+        self.captured_at, view = frame
+        return view
+
+    def close(self, timeout=2.0):
+        self.ring.stop()
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+        self.ring.close()
+
+    def stats(self):
+        return (
+            f"Capture process: {self.frames} frames read, {self.skipped} "
+            f"skipped, {self.overwritten} overwritten while in use, "
+            f"{self.restarts} restarts"
+        )
+
+
+if __name__ == "__main__":
+    capture_main()
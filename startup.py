@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Startup:
+    # Runs independent startup steps on worker threads and records when
+    # each one started and finished relative to launch, so the timeline
+    # shows which step capture actually waited for.
+    #
+    #   submit(name, fn)  run fn on a worker; returns its Future
+    #   step(name)        time a step on the calling thread (with-block)
+    #   mark(name)        record the first time something happened
+
+    def __init__(self, workers=4, clock=time.monotonic):
+        self.clock = clock
+        self.launched = clock()
+        self.lock = threading.Lock()
+        self.events = []
+        self.marked = set()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="startup"
+        )
+
+    def offset(self):
+        return self.clock() - self.launched
+
+    def record(self, name, start, error=None):
+        end = self.offset()
+        with self.lock:
+            self.events.append((name, start, end, error))
+        outcome = f"failed: {error}" if error else "done"
+        print(f"Startup +{end:.2f}s: {name} {outcome} ({end - start:.2f}s)")
+
+    def submit(self, name, fn, *args):
+        def run():
+            start = self.offset()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.record(name, start, e)
+                raise
+            self.record(name, start)
+            return result
+
+        return self.executor.submit(run)
+
+    def step(self, name):
+        return StartupStep(self, name)
+
+    def mark(self, name):
+        with self.lock:
+            if name in self.marked:
+                return
+            self.marked.add(name)
+        now = self.offset()
+        with self.lock:
+            self.events.append((name, now, now, None))
+        print(f"Startup +{now:.2f}s: {name}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def timeline(self, width=40):
+        # One line per step in start order, with a bar spanning its time
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event[1:3])
+        if not events:
+            return "Startup timeline: nothing recorded"
+        total = max(end for _, _, end, _ in events) or 1.0
+        lines = [f"Startup timeline ({total:.2f}s):"]
+        for name, start, end, error in events:
+            left = min(int(width * start / total), width - 1)
+            length = max(int(width * end / total) - left, 1)
+            bar = " " * left + "#" * length
+            status = " (failed)" if error else ""
+            lines.append(
+                f"  {start:6.2f}s {end:6.2f}s  {bar:<{width}}  {name}{status}"
+            )
+        return "\n".join(lines)
+
+
+class StartupStep:
+    def __init__(self, startup, name):
+        self.startup = startup
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.startup.offset()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.startup.record(self.name, self.start, exc)
+        return False
@@ -0,0 +1,138 @@
+import glob
+import time
+
+import cv2
+import numpy as np
+
+from capture import resolve_roi
+from inference import load_image
+
+
+class TemplateMatcher:
+    # Recognizes the queue pop dialog by normalized cross-correlation against
+    # reference crops of it, which takes a fraction of a millisecond.
+    #
+    # Matching runs on the model's preprocessed input (float32 RGB 0-1,
+    # already cropped to CAPTURE_ROI), reduced to a small grayscale image of
+    # `size`. Templates are the `box` region of that image, given as
+    # fractions like a ROI, so the dialog may shift by the margin around the
+    # box and still match.
+
+    def __init__(self, templates, size=(64, 64)):
+        self.templates = list(templates)
+        self.size = size
+
+    def normalize(self, img):
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+
+    @classmethod
+    def harvest(
+        cls,
+        paths,
+        input_size,
+        size=(64, 64),
+        box=(0.2, 0.2, 0.6, 0.6),
+        roi=None,
+        max_templates=8,
+        min_contrast=0.02,
+        duplicate_score=0.98,
+    ):
+        # Build templates from labeled screenshots of the dialog
+        # (train/queue_pop). Blank images and near-duplicates of a template
+        # already taken are skipped.
+        matcher = cls([], size)
+        left, top, width, height = resolve_roi(box, *size)
+        for path in paths:
+            try:
+                img = load_image(path, input_size, roi)
+            except ValueError:
+                continue
+            gray = matcher.normalize(img)
+            template = np.ascontiguousarray(
+                gray[top : top + height, left : left + width]
+            )
+            if template.std() < min_contrast:
+                continue
+            if matcher.templates and matcher.match(gray) >= duplicate_score:
+                continue
+            matcher.templates.append(template)
+            if len(matcher.templates) >= max_templates:
+                break
+        return matcher
+
+    @classmethod
+    def from_glob(cls, pattern, input_size, **options):
+        return cls.harvest(sorted(glob.glob(pattern)), input_size, **options)
+
+    def match(self, gray):
+        best = 0.0
+        for template in self.templates:
+            result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+            best = max(best, float(result.max()))
+        return best
+
+    def score(self, img):
+        # Best correlation (0-1) of any template with the preprocessed frame
+        return self.match(self.normalize(img))
+
+
+class TemplateDetector:
+    # Detector plugin with the same interface as an inference backend.
+    # Template matching answers first: a score of at least `hit` is a pop
+    # and one of at most `miss` is not, without running the model. Only
+    # frames whose template score falls in between are passed on to the
+    # model. Pick the thresholds with utilities/compare_detectors.py --sweep.
+
+    name = "template"
+
+    def __init__(self, model, matcher, hit=0.8, miss=0.4):
+        self.model = model
+        self.matcher = matcher
+        self.hit = hit
+        self.miss = miss
+        self.input_size = model.input_size
+        self.frame = model.frame
+
+        self.last_template_score = None
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.template_seconds = 0.0
+        self.model_seconds = 0.0
+
+    def predict_one(self, img):
+        start = time.perf_counter()
+        score = self.matcher.score(img)
+        self.template_seconds += time.perf_counter() - start
+        self.last_template_score = score
+
+        if score >= self.hit:
+            self.hits += 1
+            return 1.0
+        if score <= self.miss:
+            self.misses += 1
+            return 0.0
+
+        self.fallbacks += 1
+        start = time.perf_counter()
+        prediction = self.model.predict_one(img)
+        self.model_seconds += time.perf_counter() - start
+        return prediction
+
+    def predict_batch(self, images):
+        return np.array([self.predict_one(img) for img in images])
+
+    def stats(self):
+        frames = self.hits + self.misses + self.fallbacks
+        if not frames:
+            return "Template detector: no frames"
+        template_ms = 1000 * self.template_seconds / frames
+        model_ms = 1000 * self.model_seconds / max(self.fallbacks, 1)
+        return (
+            f"Template detector: {len(self.matcher.templates)} templates, "
+            f"{self.hits} hits, {self.misses} misses, {self.fallbacks} "
+            f"model fallbacks ({100 * self.fallbacks / frames:.1f}%), "
+            f"template {template_ms:.2f}ms/frame, "
+            f"model {model_ms:.2f}ms/fallback"
+        )
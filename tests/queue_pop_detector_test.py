@@ -1,38 +1,75 @@
 import os
-import cv2
-import numpy as np
-from tensorflow.keras.models import load_model
-import shutil
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_classifier import (  # noqa: E402
+    BatchClassifier,
+    FileMover,
+    ResultsManifest,
+)
+from capture import parse_roi  # noqa: E402
+from inference import load_backend  # noqa: E402
+
+load_dotenv()
 
 # Load the trained model
-model = load_model("queue_pop_detector.h5")
+model_path = "queue_pop_detector.h5"
+model = load_backend(model_path)
+roi = parse_roi(os.environ.get("CAPTURE_ROI"))
 
 # Create directory to store incorrectly classified images
 if not os.path.exists("incorrectly_classified"):
     os.makedirs("incorrectly_classified")
 
+# Classify in batches; scores go to a manifest so an interrupted run resumes
+# where it stopped (unless the model or ROI changed since), and
+# misclassified images are moved in the background
+manifest = ResultsManifest(
+    os.path.join("incorrectly_classified", "manifest.jsonl"),
+    model_path=model_path,
+    roi=roi,
+)
+# Images are cropped to CAPTURE_ROI, the region the model was trained on
+classifier = BatchClassifier(model, batch_size=64, roi=roi, manifest=manifest)
+mover = FileMover()
+
 # Loop through each image in the train and val sets
-for dataset in ["train", "val"]:
-    for label in ["not_queue_pop", "queue_pop"]:
-        data_dir = os.path.join(dataset, label)
-        for img_file in os.listdir(data_dir):
-            # Load the image and preprocess it
-            img_path = os.path.join(data_dir, img_file)
-            img = cv2.imread(img_path)
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, (224, 224))
-            img = img / 255.0
-
-            # Make a prediction
-            pred = model.predict(np.expand_dims(img, axis=0), verbose=0)[0][0]
-            is_queue_pop = pred >= 0.95
-
-            # Check if the prediction is correct
-            if label == "queue_pop" and not is_queue_pop:
-                shutil.move(
-                    img_path, os.path.join("incorrectly_classified", img_file)
-                )
-            elif label == "not_queue_pop" and is_queue_pop:
-                shutil.move(
-                    img_path, os.path.join("incorrectly_classified", img_file)
-                )
+try:
+    for dataset in ["train", "val"]:
+        for label in ["not_queue_pop", "queue_pop"]:
+            data_dir = os.path.join(dataset, label)
+            img_paths = [
+                os.path.join(data_dir, img_file)
+                for img_file in sorted(os.listdir(data_dir))
+            ]
+            for img_path, pred in classifier.scores(img_paths):
+                if pred is None:
+                    continue
+                is_queue_pop = pred >= 0.95
+
+                # Check if the prediction is correct
+                if label == "queue_pop" and not is_queue_pop:
+                    mover.move(
+                        img_path,
+                        os.path.join(
+                            "incorrectly_classified",
+                            os.path.basename(img_path),
+                        ),
+                    )
+                elif label == "not_queue_pop" and is_queue_pop:
+                    mover.move(
+                        img_path,
+                        os.path.join(
+                            "incorrectly_classified",
+                            os.path.basename(img_path),
+                        ),
+                    )
+finally:
+    mover.close()
+    manifest.close()
+
+print(classifier.stats())
+print(f"Moved {mover.moved} incorrectly classified images")
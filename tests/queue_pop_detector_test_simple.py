@@ -1,18 +1,27 @@
-import cv2
-import numpy as np
-from tensorflow.keras.models import load_model
+import os
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture import parse_roi  # noqa: E402
+from inference import load_backend, load_image  # noqa: E402
+
+load_dotenv()
 
 # Load the trained model
-model = load_model("queue_pop_detector.h5")
+model = load_backend("queue_pop_detector.h5")
 
-# Load the screenshot and preprocess it
-img = cv2.imread("queue_screenshot.png")
-img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-img = cv2.resize(img, (224, 224))
-img = img / 255.0
+# Load the screenshot and crop it to CAPTURE_ROI, as the model was trained
+img = load_image(
+    "queue_screenshot.png",
+    model.input_size,
+    roi=parse_roi(os.environ.get("CAPTURE_ROI")),
+)
 
 # Make a prediction
-pred = model.predict(np.expand_dims(img, axis=0), verbose=0)[0][0]
+pred = model.predict_one(img)
 
 # Check if the queue has popped
 if pred >= 0.10:
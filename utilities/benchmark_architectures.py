@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parent.parent
+
+# Train each detector architecture on the same train/val split with
+# queue_pop_detector.py, then compare the trained models with
+# benchmark_backends.py. Candidates are "<architecture>:<input size>".
+
+DEFAULT_CANDIDATES = [
+    "vgg16:224",
+    "mobilenet_v3_small:128",
+    "efficientnet_b0:128",
+    "tiny_cnn:96",
+    "tiny_cnn:128",
+]
+
+
+def train(architecture, input_size, output, epochs, loader):
+    env = dict(
+        os.environ,
+        MODEL_ARCHITECTURE=architecture,
+        INPUT_SIZE=str(input_size),
+        MODEL_OUTPUT=output,
+        TRAIN_EPOCHS=str(epochs),
+        TRAIN_LOADER=loader,
+    )
+    completed = subprocess.run(
+        [sys.executable, str(project_root / "queue_pop_detector.py")],
+        cwd=project_root,
+        env=env,
+    )
+    return completed.returncode == 0
+
+
+def benchmark(model_path, val_dir, threshold, runs):
+    completed = subprocess.run(
+        [
+            sys.executable,
+            str(Path(__file__).resolve().parent / "benchmark_backends.py"),
+            model_path,
+            "--worker",
+            "--val-dir",
+            val_dir,
+            "--threshold",
+            str(threshold),
+            "--runs",
+            str(runs),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        print(f"Failed to benchmark {model_path}:\n{completed.stderr}")
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Train and compare detector architectures"
+    )
+    parser.add_argument(
+        "candidates",
+        nargs="*",
+        default=DEFAULT_CANDIDATES,
+        help="architecture:input_size pairs",
+    )
+    parser.add_argument("--val-dir", default=str(project_root / "val"))
+    parser.add_argument("--output-dir", default=str(project_root / "models"))
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--loader", default="tf_data")
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument(
+        "--skip-training",
+        action="store_true",
+        help="benchmark models already in --output-dir",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = []
+    for candidate in args.candidates:
+        architecture, _, input_size = candidate.partition(":")
+        input_size = int(input_size or 224)
+        model_path = os.path.join(
+            args.output_dir,
+            f"queue_pop_detector_{architecture}_{input_size}.keras",
+        )
+
+        if not args.skip_training:
+            print(f"Training {architecture} at {input_size}x{input_size}...")
+            if not train(
+                architecture, input_size, model_path, args.epochs, args.loader
+            ):
+                print(f"Training {candidate} failed")
+                continue
+        if not os.path.exists(model_path):
+            print(f"No model for {candidate} at {model_path}")
+            continue
+
+        print(f"Benchmarking {model_path}...")
+        result = benchmark(model_path, args.val_dir, args.threshold, args.runs)
+        if result is not None:
+            result["candidate"] = candidate
+            results.append(result)
+
+    if not results:
+        raise SystemExit("No models were benchmarked")
+
+    print(
+        f"\n{'architecture':<24} {'acc':>6} {'FNR':>6} {'size MB':>8} "
+        f"{'p50 ms':>7} {'p95 ms':>7}"
+    )
+    for result in results:
+        print(
+            f"{result['candidate']:<24} {result['accuracy']:6.3f} "
+            f"{result['fnr']:6.3f} {result['size_mb']:8.1f} "
+            f"{result['p50_ms']:7.2f} {result['p95_ms']:7.2f}"
+        )
+
+    # Missed pops matter most, then accuracy, then speed
+    best = min(
+        results,
+        key=lambda result: (
+            result["fnr"],
+            -result["accuracy"],
+            result["p50_ms"],
+        ),
+    )
+    print(
+        f"\nBest: {best['candidate']}. To use it in the notifier set\n"
+        f"  MODEL_PATH={os.path.join(args.output_dir, best['model'])}"
+    )
+
+
+if __name__ == "__main__":
+    main()
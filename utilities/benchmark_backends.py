@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from capture import parse_roi  # noqa: E402
+from inference import load_backend, load_image  # noqa: E402
+from metrics import peak_rss_mb  # noqa: E402
+
+# Compare inference backends (Keras .h5, TFLite, ONNX) on the val set. Each
+# model is benchmarked in its own process so load time and peak RSS are not
+# polluted by libraries another backend already imported.
+
+
+def run_worker(model_path, val_dir, threshold, runs):
+    roi = parse_roi(os.environ.get("CAPTURE_ROI"))
+
+    start = time.perf_counter()
+    backend = load_backend(model_path)
+    load_seconds = time.perf_counter() - start
+
+    total = correct = false_negatives = positives = 0
+    img = None
+    for label, expected in (("not_queue_pop", False), ("queue_pop", True)):
+        label_dir = os.path.join(val_dir, label)
+        for img_file in sorted(os.listdir(label_dir)):
+            try:
+                img = load_image(
+                    os.path.join(label_dir, img_file),
+                    backend.input_size,
+                    roi,
+                )
+            except ValueError:
+                continue
+            is_queue_pop = backend.predict_one(img) >= threshold
+            total += 1
+            correct += is_queue_pop == expected
+            positives += expected
+            false_negatives += expected and not is_queue_pop
+
+    if img is None:
+        raise SystemExit(f"No images found in {val_dir}")
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend.predict_one(img)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(
+        json.dumps(
+            {
+                "model": os.path.basename(model_path),
+                "backend": backend.name,
+                "size_mb": os.path.getsize(model_path) / (1024 * 1024),
+                "load_s": load_seconds,
+                "accuracy": correct / total,
+                "fnr": false_negatives / positives if positives else 0.0,
+                "p50_ms": float(np.percentile(timings, 50)),
+                "p95_ms": float(np.percentile(timings, 95)),
+                "rss_mb": peak_rss_mb(),
+            }
+        )
+    )
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Compare accuracy, latency and memory of model exports"
+    )
+    parser.add_argument("models", nargs="+", help=".h5, .tflite or .onnx")
+    parser.add_argument("--val-dir", default=str(project_root / "val"))
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument(
+        "--worker", action="store_true", help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.models[0], args.val_dir, args.threshold, args.runs)
+        return
+
+    results = []
+    for model_path in args.models:
+        print(f"Benchmarking {model_path}...")
+        completed = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                model_path,
+                "--worker",
+                "--val-dir",
+                args.val_dir,
+                "--threshold",
+                str(args.threshold),
+                "--runs",
+                str(args.runs),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            print(f"Failed to benchmark {model_path}:\n{completed.stderr}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(
+        f"\n{'model':<32} {'backend':<8} {'size MB':>8} {'load s':>7} "
+        f"{'acc':>6} {'FNR':>6} {'p50 ms':>7} {'p95 ms':>7} {'RSS MB':>7}"
+    )
+    for result in results:
+        rss = (
+            f"{result['rss_mb']:7.0f}"
+            if result["rss_mb"] is not None
+            else "    n/a"
+        )
+        print(
+            f"{result['model']:<32} {result['backend']:<8} "
+            f"{result['size_mb']:8.1f} {result['load_s']:7.2f} "
+            f"{result['accuracy']:6.3f} {result['fnr']:6.3f} "
+            f"{result['p50_ms']:7.2f} {result['p95_ms']:7.2f} {rss}"
+        )
+
+
+if __name__ == "__main__":
+    main()
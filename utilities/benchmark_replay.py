@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from detection import template_source_from_env  # noqa: E402
+from inference import load_backend  # noqa: E402
+from metrics import peak_rss_mb  # noqa: E402
+from replay import find_sequences, replay  # noqa: E402
+
+# End-to-end benchmark over recorded sequences (see replay.py): time from
+# a pop appearing to its notification, false alarms per hour, CPU time per
+# frame and peak RSS. Needs no display, Chromecast or Pushover, so it can
+# run in CI; --strict exits non-zero when a labeled pop is missed.
+
+
+def format_latency(latencies):
+    detected = [latency for latency in latencies if latency is not None]
+    if not detected:
+        return "-"
+    return f"{np.median(detected):.2f}s/{max(detected):.2f}s"
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Replay recorded sequences through the detection path"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=[str(project_root / "replays")],
+        help="sequence directories, videos, or folders of them",
+    )
+    parser.add_argument(
+        "--model",
+        default=os.environ.get(
+            "MODEL_PATH", str(project_root / "queue_pop_detector.h5")
+        ),
+    )
+    parser.add_argument(
+        "--templates",
+        default=template_source_from_env(),
+        help="template glob for the template detector; empty to disable",
+    )
+    parser.add_argument(
+        "--no-realtime",
+        action="store_true",
+        help="don't advance the virtual clock by the processing time",
+    )
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=1.0,
+        help="seconds after a labeled pop ends that still count as a hit",
+    )
+    parser.add_argument("--json", help="also write the results here")
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="exit with status 1 if any labeled pop is missed",
+    )
+    args = parser.parse_args()
+
+    sequences = find_sequences(args.paths)
+    if not sequences:
+        parser.error(f"no sequences found in {', '.join(args.paths)}")
+    model = load_backend(args.model)
+
+    results = []
+    print(
+        f"{'sequence':<32} {'length':>8} {'frames':>7} {'model':>6} "
+        f"{'pops':>5} {'hit':>4} {'latency p50/max':>16} {'false':>6} "
+        f"{'cpu/frame':>10}"
+    )
+    for path in sequences:
+        result = replay(
+            path,
+            model,
+            templates=args.templates or None,
+            realtime=not args.no_realtime,
+            grace=args.grace,
+        )
+        results.append(result)
+        hits = sum(latency is not None for latency in result.latencies)
+        cpu_ms = 1000 * result.cpu_seconds / max(result.frames, 1)
+        print(
+            f"{result.name[:32]:<32} {result.duration:7.0f}s "
+            f"{result.frames:7d} {result.classified:6d} {result.pops:5d} "
+            f"{hits:4d} {format_latency(result.latencies):>16} "
+            f"{result.false_alarms:6d} {cpu_ms:8.2f}ms"
+        )
+
+    latencies = [latency for r in results for latency in r.latencies]
+    detected = [latency for latency in latencies if latency is not None]
+    hours = sum(r.duration for r in results) / 3600
+    frames = sum(r.frames for r in results)
+    false_alarms = sum(r.false_alarms for r in results)
+    summary = {
+        "sequences": len(results),
+        "hours": hours,
+        "pops": len(latencies),
+        "missed": len(latencies) - len(detected),
+        "latency_p50_s": float(np.median(detected)) if detected else None,
+        "latency_p95_s": (
+            float(np.percentile(detected, 95)) if detected else None
+        ),
+        "latency_max_s": max(detected) if detected else None,
+        "false_alarms": false_alarms,
+        "false_alarms_per_hour": false_alarms / hours if hours else None,
+        "cpu_ms_per_frame": (
+            1000 * sum(r.cpu_seconds for r in results) / frames
+            if frames
+            else None
+        ),
+        "wall_seconds": sum(r.wall_seconds for r in results),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    print()
+    if detected:
+        print(
+            f"Pop to notification: p50 {summary['latency_p50_s']:.2f}s, "
+            f"p95 {summary['latency_p95_s']:.2f}s, "
+            f"max {summary['latency_max_s']:.2f}s; "
+            f"{summary['missed']} of {summary['pops']} pops missed"
+        )
+    else:
+        print(f"No pops detected; {summary['missed']} missed")
+    if hours:
+        print(
+            f"False alarms: {false_alarms} in {hours:.2f}h "
+            f"({summary['false_alarms_per_hour']:.2f}/h)"
+        )
+    if frames:
+        print(
+            f"CPU {summary['cpu_ms_per_frame']:.2f}ms/frame over {frames} "
+            f"frames, replayed in {summary['wall_seconds']:.1f}s"
+        )
+    if summary["peak_rss_mb"] is not None:
+        print(f"Peak RSS {summary['peak_rss_mb']:.0f}MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "summary": summary,
+                    "sequences": [r._asdict() for r in results],
+                },
+                f,
+                indent=2,
+            )
+    if args.strict and summary["missed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import functools
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from capture import ScreenCapture, capture_region, parse_roi  # noqa: E402
+from inference import load_backend, preprocess  # noqa: E402
+from shared_frames import SharedFrameSource, SyntheticCapture  # noqa: E402
+
+# Compare the single-process capture/detect loop with capture running in its
+# own process behind a shared-memory ring. Reports processed frames/sec and
+# end-to-end latency from the end of the grab to the model score.
+
+
+def summarize(name, frames, seconds, latencies):
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    print(
+        f"{name:<16} {frames / seconds:8.1f} frames/s   "
+        f"latency p50 {p50:6.2f}ms  p95 {p95:6.2f}ms"
+    )
+
+
+def run_single(model, source_factory, duration):
+    source = source_factory()
+    latencies = []
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        frame = source.grab()
+        captured_at = time.monotonic()
+        model.predict_one(preprocess(frame, model.input_size, out=model.frame))
+        latencies.append(time.monotonic() - captured_at)
+    source.close()
+    summarize("single process", len(latencies), duration, latencies)
+
+
+def run_shared(model, shared_factory, duration):
+    source = shared_factory()
+    # Let the capture process start up before timing
+    source.grab(timeout=30)
+    latencies = []
+    start = time.monotonic()
+    first = source.ring.latest
+    while time.monotonic() - start < duration:
+        frame = source.grab()
+        model.predict_one(preprocess(frame, model.input_size, out=model.frame))
+        latencies.append(time.monotonic() - source.captured_at)
+    captured = source.ring.latest - first
+    source.close()
+    summarize("shared memory", len(latencies), duration, latencies)
+    print(f"  {captured / duration:.1f} frames/s captured; {source.stats()}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Benchmark the shared-memory capture process"
+    )
+    parser.add_argument(
+        "--model",
+        default=os.environ.get(
+            "MODEL_PATH", str(project_root / "queue_pop_detector.h5")
+        ),
+    )
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument(
+        "--period",
+        type=float,
+        default=0.0,
+        help="capture period in the capture process (0 = as fast as it can)",
+    )
+    parser.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="use generated frames instead of grabbing the screen",
+    )
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=450)
+    parser.add_argument("--capture-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = load_backend(args.model)
+    if args.synthetic:
+        shape = (args.height, args.width, 4)
+        factory = functools.partial(
+            SyntheticCapture, shape, args.capture_ms / 1000
+        )
+        shared_factory = functools.partial(
+            SharedFrameSource.synthetic,
+            shape,
+            args.capture_ms,
+            period=args.period,
+        )
+    else:
+        monitor = int(os.environ.get("CAPTURE_MONITOR", "0"))
+        roi = parse_roi(os.environ.get("CAPTURE_ROI"))
+        region = capture_region(monitor, roi)
+        shape = (region["height"], region["width"], 4)
+        factory = functools.partial(ScreenCapture, monitor, roi)
+        shared_factory = functools.partial(
+            SharedFrameSource.for_screen, monitor, roi, period=args.period
+        )
+
+    print(f"{shape[1]}x{shape[0]} frames, {args.seconds:.0f}s per mode")
+    run_single(model, factory, args.seconds)
+    run_shared(model, shared_factory, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,212 +1,207 @@
+import argparse
+import json
 import os
 import random
 import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from dataset_index import DatasetIndex  # noqa: E402
+
+# Rebalance the dataset so each category is split train_ratio/1-train_ratio
+# between train and val, with every labeled screenshot added to the pool.
+#
+# The tree is scanned once (through the dataset index), the final location
+# of every file is planned in memory, and only files whose location changes
+# are moved: files already in a split that still has room stay put. Moves
+# are written to a journal before they run so a run can be rolled back.
+# Every run that isn't a dry run rewrites the journal under a new run id,
+# even with nothing to move, so --rollback only ever undoes the latest run;
+# pass the id printed by a run to make sure it is that one.
+
+
+def unique_destination(directory, name, taken):
+    # Pick a name in `directory` that no existing or planned file uses
+    base, ext = os.path.splitext(name)
+    candidate = name
+    counter = 1
+    while candidate in taken:
+        candidate = f"{base}_{counter}{ext}"
+        counter += 1
+    taken.add(candidate)
+    return os.path.join(directory, candidate)
+
+
+def plan_category(index, category, train_ratio, rng):
+    # Returns [(src, dst)] for one category
+    train = index.paths("train", category)
+    val = index.paths("val", category)
+    screenshots = index.paths("screenshots", category)
+
+    total = len(train) + len(val) + len(screenshots)
+    target_train = int(total * train_ratio)
+    target_val = total - target_train
+
+    # Keep as many files in place as the targets allow; everything else,
+    # including every new screenshot, fills the remaining slots
+    rng.shuffle(train)
+    rng.shuffle(val)
+    pool = train[target_train:] + val[target_val:] + screenshots
+    rng.shuffle(pool)
+    train_slots = max(target_train - len(train), 0)
+
+    directories = {
+        split: str(project_root / split / category)
+        for split in ("train", "val")
+    }
+    taken = {
+        split: {os.path.basename(path) for path in paths}
+        for split, paths in (("train", train), ("val", val))
+    }
+
+    moves = []
+    for i, src in enumerate(pool):
+        split = "train" if i < train_slots else "val"
+        if os.path.dirname(src) == directories[split]:
+            continue
+        dst = unique_destination(
+            directories[split], os.path.basename(src), taken[split]
+        )
+        moves.append((src, dst))
 
-def count_images_in_directory(directory):
-    return sum([len(files) for _, _, files in os.walk(directory)])
-
-
-def move_images(src, dest, num_images_to_move):
-    src_files = [f for f in src.iterdir() if f.is_file()]
-    random.shuffle(src_files)
-    num_images_to_move = min(num_images_to_move, len(src_files))
-
-    for i in range(num_images_to_move):
-        file_to_move = src_files[i]
-        destination_path = dest / file_to_move.name
-
-        if destination_path.exists():
-            file_base, file_ext = os.path.splitext(file_to_move.name)
-            counter = 1
-            while destination_path.exists():
-                new_file_name = f"{file_base}_{counter}{file_ext}"
-                destination_path = dest / new_file_name
-                counter += 1
+    print(
+        f"{category}: {total} images -> train {target_train}, "
+        f"val {target_val}; {len(moves)} moves"
+    )
+    return moves
 
-        shutil.move(str(file_to_move), destination_path)
 
+def execute(moves, journal_path, workers, index):
+    # Journal the whole plan under a new run id first, then move in parallel
+    run_id = time.strftime("%Y-%m-%d_%H-%M-%S")
+    with open(journal_path, "w") as journal:
+        journal.write(json.dumps({"run": run_id, "moves": len(moves)}) + "\n")
+        for src, dst in moves:
+            journal.write(json.dumps({"src": src, "dst": dst}) + "\n")
 
-def balance_train_val(
-    train_dir, val_dir, category, target_total_images, ideal_train_ratio
-):
-    print(f"Processing category: {category}")
+    for directory in {os.path.dirname(dst) for _, dst in moves}:
+        os.makedirs(directory, exist_ok=True)
 
-    train_dir_category = train_dir / category
-    val_dir_category = val_dir / category
+    def move(paths):
+        shutil.move(*paths)
+        return paths
 
-    train_count = count_images_in_directory(train_dir_category)
-    print(f"Train images for {category}: {train_count}")
-    val_count = count_images_in_directory(val_dir_category)
-    print(f"Val images for {category}: {val_count}")
+    with ThreadPoolExecutor(workers) as pool:
+        for src, dst in pool.map(move, moves):
+            index.move(src, dst, project_root)
+    index.commit()
+    print(f"Rebalance run {run_id}: {len(moves)} moves journaled")
 
-    total_count = train_count + val_count
 
-    if total_count == 0:
-        print(f"No images found for category: {category}")
+def rollback(journal_path, index, run_id=None):
+    with open(journal_path) as journal:
+        records = [json.loads(line) for line in journal if line.strip()]
+    header = records[0] if records and "run" in records[0] else None
+    if header is None:
+        print(f"{journal_path} has no run id; not rolling back")
         return
-
-    ideal_train_count = int(target_total_images * ideal_train_ratio)
-    ideal_val_count = target_total_images - ideal_train_count
-
-    print(
-        f"Initial total images for {category}: Train: {train_count}, Val: {val_count}"
-    )
-
-    if train_count > ideal_train_count:
-        num_images_to_move = train_count - ideal_train_count
-        print(
-            f"Moving {num_images_to_move} images from train to val for category {category}"
-        )
-        move_images(train_dir_category, val_dir_category, num_images_to_move)
-    elif train_count < ideal_train_count:
-        num_images_to_move = ideal_train_count - train_count
+    if header.get("rolled_back"):
+        print(f"Run {header['run']} was already rolled back")
+        return
+    if run_id is not None and run_id != header["run"]:
         print(
-            f"Moving {num_images_to_move} images from val to train for category {category}"
+            f"{journal_path} is for run {header['run']}, not {run_id}; "
+            "not rolling back"
         )
-        move_images(val_dir_category, train_dir_category, num_images_to_move)
-
-    val_count = count_images_in_directory(val_dir_category)
-    print(f"Val images for {category} after balancing: {val_count}")
-
-    if val_count > ideal_val_count:
-        move_images(
-            val_dir / category,
-            train_dir / category,
-            val_count - ideal_val_count,
-        )
-    # If there are fewer images in the val set than the ideal number, move images from the train set to the val set
-    elif val_count < ideal_val_count:
-        move_images(
-            train_dir / category,
-            val_dir / category,
-            ideal_val_count - val_count,
-        )
-
-    # Display the final number of images in the train and val sets for the category after balancing
+        return
+    moves = records[1:]
+    restored = 0
+    for move in reversed(moves):
+        if os.path.exists(move["dst"]) and not os.path.exists(move["src"]):
+            os.makedirs(os.path.dirname(move["src"]), exist_ok=True)
+            shutil.move(move["dst"], move["src"])
+            index.move(move["dst"], move["src"], project_root)
+            restored += 1
+    index.commit()
     print(
-        f"Final total images for {category}: Train: {count_images_in_directory(train_dir / category)}, "
-        f"Val: {count_images_in_directory(val_dir / category)}"
+        f"Restored {restored} of {len(moves)} moved files "
+        f"from run {header['run']}"
     )
 
+    # Keep the record, but make sure a second rollback is a no-op
+    with open(journal_path, "w") as journal:
+        journal.write(json.dumps(dict(header, rolled_back=True)) + "\n")
+        for move in moves:
+            journal.write(json.dumps(move) + "\n")
 
-def balance_categories(train_dir, val_dir, categories):
-    # Calculate the total number of images across all categories by summing the count of images in
-    # the train and val directories for each category.
-    total_images = sum(
-        [
-            count_images_in_directory(train_dir / category)
-            + count_images_in_directory(val_dir / category)
-            for category in categories
-        ]
-    )
 
-    # Calculate the ideal number of images per category for a balanced distribution by dividing
-    # the total number of images by the number of categories.
-    ideal_images_per_category = total_images // len(categories)
-
-    # Iterate through each category to balance the total number of images between categories.
-    for category in categories:
-        # Get the current count of images in the train and val directories for the category.
-        current_train_count = count_images_in_directory(train_dir / category)
-        current_val_count = count_images_in_directory(val_dir / category)
-
-        # Calculate the current total count of images for the category.
-        current_total_count = current_train_count + current_val_count
-
-        # If the current total count is greater than the ideal count, move the excess images
-        # from the train directory to the val directory.
-        if current_total_count > ideal_images_per_category:
-            move_images(
-                train_dir / category,
-                val_dir / category,
-                current_total_count - ideal_images_per_category,
-            )
-        # If the current total count is less than the ideal count, move the required number of
-        # images from the val directory to the train directory to achieve the ideal count.
-        elif current_total_count < ideal_images_per_category:
-            move_images(
-                val_dir / category,
-                train_dir / category,
-                ideal_images_per_category - current_total_count,
-            )
-
-    # Iterate through each category to balance the train and val sets for the category using
-    # the updated total count for each category.
-    for category in categories:
-        # Get the current count of images in the train and val directories for the category.
-        current_train_count = count_images_in_directory(train_dir / category)
-        current_val_count = count_images_in_directory(val_dir / category)
-
-        # Calculate the current total count of images for the category.
-        current_total_count = current_train_count + current_val_count
-
-        # Call the balance_train_val function with the current total count for the category and
-        # an ideal_train_ratio of 0.8 (80% of images in the train set, 20% in the val set).
-        balance_train_val(
-            train_dir,
-            val_dir,
-            category,
-            current_total_count,
-            ideal_train_ratio=0.8,
-        )
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebalance train/val with the fewest file moves"
+    )
+    parser.add_argument("--train-ratio", type=float, default=0.8)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--journal", default=str(project_root / "rebalance_journal.jsonl")
+    )
+    parser.add_argument(
+        "--rollback",
+        nargs="?",
+        const="latest",
+        metavar="RUN_ID",
+        help="undo the moves of the latest run, or of RUN_ID if it is the "
+        "latest",
+    )
+    args = parser.parse_args()
 
+    categories = ["queue_pop", "not_queue_pop"]
 
-def move_screenshots_to_train_val(
-    screenshots_dir, train_dir, val_dir, categories
-):
-    for category in categories:
-        count_train = count_images_in_directory(train_dir / category)
-        count_val = count_images_in_directory(val_dir / category)
-        total = count_train + count_val
-        ideal_train_count = int(total * 0.8)
-        num_images_to_move = ideal_train_count - count_train
-        if num_images_to_move > 0:
-            print(
-                f"Moving {num_images_to_move} images from screenshots to train for category {category}"
-            )
-            move_images(
-                screenshots_dir / category,
-                train_dir / category,
-                num_images_to_move,
-            )
-        elif num_images_to_move < 0:
-            print(
-                f"Moving {abs(num_images_to_move)} images from train to screenshots for category {category}"
-            )
-            move_images(
-                train_dir / category,
-                screenshots_dir / category,
-                abs(num_images_to_move),
+    with DatasetIndex(str(project_root / "dataset_index.sqlite3")) as index:
+        if args.rollback:
+            rollback(
+                args.journal,
+                index,
+                None if args.rollback == "latest" else args.rollback,
             )
+            return
 
+        start = time.perf_counter()
+        index.sync(project_root)
+        scanned = time.perf_counter()
 
-def main():
-    project_root = Path(__file__).resolve().parent.parent
-    train_dir = project_root / "train"
-    val_dir = project_root / "val"
-    screenshots_dir = project_root / "screenshots"
-    categories = ["queue_pop", "not_queue_pop"]
-
-    print("Moving all images from screenshots to train directories...")
-    for category in categories:
-        move_images(
-            screenshots_dir / category,
-            train_dir / category,
-            count_images_in_directory(screenshots_dir / category),
-        )
+        rng = random.Random(args.seed)
+        moves = []
+        for category in categories:
+            moves += plan_category(index, category, args.train_ratio, rng)
+        planned = time.perf_counter()
 
-    print("Balancing categories...")
-    balance_categories(train_dir, val_dir, categories)
+        if args.dry_run:
+            for src, dst in moves:
+                print(f"  {src} -> {dst}")
+        else:
+            execute(moves, args.journal, args.workers, index)
+        done = time.perf_counter()
 
-    print("\nFinal image counts:")
-    for category in categories:
         print(
-            f"{category}: Train: {count_images_in_directory(train_dir / category)}, "
-            f"Val: {count_images_in_directory(val_dir / category)}"
+            f"Scan {scanned - start:.2f}s, plan {planned - scanned:.2f}s, "
+            f"{'dry run' if args.dry_run else 'moves'} "
+            f"{done - planned:.2f}s ({len(moves)} files)"
         )
 
+        print(f"\n{'Current' if args.dry_run else 'Final'} image counts:")
+        for category in categories:
+            print(
+                f"{category}: Train: {index.count('train', category)}, "
+                f"Val: {index.count('val', category)}"
+            )
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,211 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from capture import parse_roi  # noqa: E402
+from inference import load_backend, load_image  # noqa: E402
+from template_matcher import TemplateMatcher  # noqa: E402
+
+# Run the CNN, template matching alone and the template-first hybrid used by
+# the notifier (TEMPLATE_MATCHING=1) over the labeled train/val folders, and
+# report how often they agree, what each misses and what each costs per
+# frame. The templates come from train/queue_pop, so only the val numbers
+# are unbiased. With --sweep, also try hit/miss thresholds on the non-train
+# splits and list the ones that cost no accuracy against the CNN, fewest
+# model fallbacks first.
+
+HIT_GRID = np.round(np.arange(0.5, 1.0, 0.05), 2)
+MISS_GRID = np.round(np.arange(0.0, 0.8, 0.05), 2)
+
+
+def summarize(name, predicted, expected, cost_ms):
+    correct = np.count_nonzero(predicted == expected)
+    misses = np.count_nonzero(expected & ~predicted)
+    false_alarms = np.count_nonzero(~expected & predicted)
+    print(
+        f"  {name:<10} acc {correct / len(expected):6.3f}  "
+        f"misses {misses:4d}/{np.count_nonzero(expected):<4d} "
+        f"false alarms {false_alarms:4d}  {cost_ms:7.3f} ms/frame"
+    )
+
+
+def compare(split_dir, model, matcher, args, roi):
+    paths, expected, cnn_scores, template_scores = [], [], [], []
+    cnn_seconds = template_seconds = 0.0
+    for label, is_pop in (("not_queue_pop", False), ("queue_pop", True)):
+        label_dir = os.path.join(split_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for img_file in sorted(os.listdir(label_dir)):
+            path = os.path.join(label_dir, img_file)
+            try:
+                img = load_image(path, model.input_size, roi, out=model.frame)
+            except ValueError:
+                continue
+
+            start = time.perf_counter()
+            template_scores.append(matcher.score(img))
+            template_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cnn_scores.append(model.predict_one(img))
+            cnn_seconds += time.perf_counter() - start
+
+            paths.append(path)
+            expected.append(is_pop)
+
+    if not paths:
+        print(f"{split_dir}: no images")
+        return None
+
+    expected = np.array(expected)
+    cnn_scores = np.array(cnn_scores)
+    template_scores = np.array(template_scores)
+    count = len(paths)
+
+    cnn = cnn_scores >= args.threshold
+    template = template_scores >= args.hit
+    ambiguous = (template_scores > args.miss) & ~template
+    hybrid = template | (ambiguous & cnn)
+
+    template_ms = 1000 * template_seconds / count
+    cnn_ms = 1000 * cnn_seconds / count
+    hybrid_ms = template_ms + cnn_ms * np.count_nonzero(ambiguous) / count
+
+    print(f"{split_dir}: {count} images")
+    summarize("cnn", cnn, expected, cnn_ms)
+    summarize("template", template, expected, template_ms)
+    summarize("hybrid", hybrid, expected, hybrid_ms)
+    print(
+        f"  template/cnn agreement {np.mean(template == cnn):.3f}, "
+        f"hybrid/cnn agreement {np.mean(hybrid == cnn):.3f}, "
+        f"model fallbacks {np.count_nonzero(ambiguous)} "
+        f"({100 * np.mean(ambiguous):.1f}%)"
+    )
+    if args.verbose:
+        for path, pop, cnn_pop, hybrid_pop, template_score, cnn_score in zip(
+            paths, expected, cnn, hybrid, template_scores, cnn_scores
+        ):
+            if hybrid_pop != pop or cnn_pop != pop:
+                print(
+                    f"    {path}: template {template_score:.2f}, "
+                    f"cnn {cnn_score:.2f}"
+                )
+    return expected, cnn_scores, template_scores
+
+
+def sweep(results, threshold, show=5):
+    # Hybrid errors and model fallbacks for each hit/miss pair, keeping
+    # pairs that miss no more pops and raise no more false alarms than the
+    # CNN alone
+    expected = np.concatenate([scored[0] for scored in results])
+    cnn_scores = np.concatenate([scored[1] for scored in results])
+    template_scores = np.concatenate([scored[2] for scored in results])
+    cnn = cnn_scores >= threshold
+    cnn_misses = np.count_nonzero(expected & ~cnn)
+    cnn_false_alarms = np.count_nonzero(~expected & cnn)
+
+    candidates = []
+    for hit in HIT_GRID:
+        for miss in MISS_GRID[MISS_GRID < hit]:
+            template = template_scores >= hit
+            ambiguous = (template_scores > miss) & ~template
+            hybrid = template | (ambiguous & cnn)
+            misses = np.count_nonzero(expected & ~hybrid)
+            false_alarms = np.count_nonzero(~expected & hybrid)
+            if misses <= cnn_misses and false_alarms <= cnn_false_alarms:
+                candidates.append((np.mean(ambiguous), hit - miss, hit, miss))
+
+    print(
+        f"Sweep over {len(expected)} held-out images "
+        f"(cnn: {cnn_misses} misses, {cnn_false_alarms} false alarms)"
+    )
+    if not candidates:
+        print("  no thresholds match the CNN; leave TEMPLATE_MATCHING off")
+        return
+    # Fewest fallbacks first, then the widest ambiguous band for margin
+    candidates.sort(key=lambda candidate: (candidate[0], -candidate[1]))
+    for fallbacks, _, hit, miss in candidates[:show]:
+        print(
+            f"  TEMPLATE_HIT_SCORE={hit:g} TEMPLATE_MISS_SCORE={miss:g}: "
+            f"model fallbacks {100 * fallbacks:.1f}%"
+        )
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Compare template matching with the CNN detector"
+    )
+    parser.add_argument(
+        "--model",
+        default=os.environ.get("MODEL_PATH", "queue_pop_detector.h5"),
+    )
+    parser.add_argument(
+        "--templates",
+        default=os.environ.get(
+            "TEMPLATE_SOURCE",
+            str(project_root / "train" / "queue_pop" / "*"),
+        ),
+        help="glob of labeled queue pop screenshots to build templates from",
+    )
+    parser.add_argument(
+        "--splits",
+        nargs="+",
+        default=[str(project_root / "train"), str(project_root / "val")],
+    )
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument(
+        "--hit",
+        type=float,
+        default=float(os.environ.get("TEMPLATE_HIT_SCORE", "0.8")),
+    )
+    parser.add_argument(
+        "--miss",
+        type=float,
+        default=float(os.environ.get("TEMPLATE_MISS_SCORE", "0.4")),
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="search for TEMPLATE_HIT_SCORE/TEMPLATE_MISS_SCORE values",
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    # Training screenshots are full frames; crop them like the notifier's
+    # capture does
+    roi = parse_roi(os.environ.get("CAPTURE_ROI"))
+    model = load_backend(args.model)
+    matcher = TemplateMatcher.from_glob(
+        args.templates, model.input_size, roi=roi
+    )
+    if not matcher.templates:
+        raise SystemExit(f"No usable templates in {args.templates}")
+    print(f"{len(matcher.templates)} templates from {args.templates}")
+
+    results = {}
+    for split_dir in args.splits:
+        scored = compare(split_dir, model, matcher, args, roi)
+        if scored is not None:
+            results[split_dir] = scored
+    if args.sweep:
+        held_out = [
+            scored
+            for split_dir, scored in results.items()
+            if os.path.basename(os.path.normpath(split_dir)) != "train"
+        ]
+        sweep(held_out or list(results.values()), args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import glob
+import os
+import random
+import sys
+from pathlib import Path
+
+import tensorflow as tf
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from capture import parse_roi  # noqa: E402
+from inference import load_image  # noqa: E402
+
+
+def representative_dataset(calibration_dir, size, roi, num_samples=200):
+    # Sample training images to calibrate int8 quantization ranges
+    image_paths = glob.glob(os.path.join(calibration_dir, "*", "*.jpg"))
+    image_paths += glob.glob(os.path.join(calibration_dir, "*", "*.png"))
+    random.shuffle(image_paths)
+
+    def generator():
+        for image_path in image_paths[:num_samples]:
+            yield [load_image(image_path, size, roi)[tf.newaxis]]
+
+    return generator
+
+
+def export_tflite(model, output_path, quantize, calibration_dir, roi):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        _, height, width, _ = model.input_shape
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(
+            calibration_dir, (width, height), roi
+        )
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8
+        ]
+
+    with open(output_path, "wb") as output_file:
+        output_file.write(converter.convert())
+
+
+def export_onnx(model, output_path):
+    import tf2onnx
+
+    _, height, width, channels = model.input_shape
+    input_signature = (
+        tf.TensorSpec((None, height, width, channels), tf.float32, "input"),
+    )
+    tf2onnx.convert.from_keras(
+        model,
+        input_signature=input_signature,
+        opset=13,
+        output_path=output_path,
+    )
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Export the trained Keras model to TFLite or ONNX"
+    )
+    parser.add_argument(
+        "--model", default=str(project_root / "queue_pop_detector.h5")
+    )
+    parser.add_argument(
+        "--format", choices=["tflite", "onnx"], default="tflite"
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=["none", "float16", "int8"],
+        default="none",
+        help="TFLite only; int8 is calibrated on --calibration-dir",
+    )
+    parser.add_argument(
+        "--calibration-dir", default=str(project_root / "train")
+    )
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    output_path = args.output
+    if not output_path:
+        suffix = "" if args.quantize == "none" else f"_{args.quantize}"
+        output_path = (
+            f"{os.path.splitext(args.model)[0]}{suffix}.{args.format}"
+        )
+
+    model = tf.keras.models.load_model(args.model)
+    if args.format == "tflite":
+        export_tflite(
+            model,
+            output_path,
+            args.quantize,
+            args.calibration_dir,
+            parse_roi(os.environ.get("CAPTURE_ROI")),
+        )
+    else:
+        if args.quantize != "none":
+            print("Quantization is only supported for TFLite; ignoring it.")
+        export_onnx(model, output_path)
+
+    size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    print(f"Exported {args.model} to {output_path} ({size_mb:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from dataset_index import DatasetIndex  # noqa: E402
+
+# Update the dataset index (dataset_index.sqlite3), print image counts and
+# report duplicate screenshots. With --dedupe, exact and near-identical
+# copies within the same split and label are moved to duplicates/ so they
+# stop skewing training. Near-identical images labeled differently (likely
+# labeling errors) or present in both train and val are only reported, for
+# a person to sort out.
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Index the dataset and find duplicate screenshots"
+    )
+    parser.add_argument(
+        "--index", default=str(project_root / "dataset_index.sqlite3")
+    )
+    parser.add_argument(
+        "--max-distance",
+        type=int,
+        default=4,
+        help="perceptual hash bits that may differ for a near-duplicate",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="move duplicates to the duplicates directory",
+    )
+    parser.add_argument(
+        "--duplicates-dir", default=str(project_root / "duplicates")
+    )
+    args = parser.parse_args()
+
+    with DatasetIndex(args.index) as index:
+        start = time.perf_counter()
+        changes = index.sync(project_root)
+        print(
+            f"Synced in {time.perf_counter() - start:.1f}s: "
+            + ", ".join(f"{count} {kind}" for kind, count in changes.items())
+        )
+
+        for (split, label), count in sorted(
+            index.counts().items(), key=lambda item: str(item[0])
+        ):
+            print(f"{split}/{label or '-'}: {count}")
+
+        duplicates = [
+            (group[0], path)
+            for group in index.exact_duplicates()
+            for path in group[1:]
+        ]
+        exact = {path for _, path in duplicates}
+        duplicates += [
+            (kept, path)
+            for kept, path in index.near_duplicates(args.max_distance)
+            if path not in exact and kept not in exact
+        ]
+        print(
+            f"{len(exact)} exact and {len(duplicates) - len(exact)} "
+            f"near-duplicate images"
+        )
+
+        # Report each cross match once, against the copy that is kept
+        duplicated = {path for _, path in duplicates}
+        conflicts, leaks = [], []
+        for a, b, distance in index.cross_matches(args.max_distance):
+            if a["path"] in duplicated or b["path"] in duplicated:
+                continue
+            splits = {a["split"], b["split"]}
+            if a["label"] and b["label"] and a["label"] != b["label"]:
+                conflicts.append((a, b, distance))
+            elif a["label"] == b["label"] and splits == {"train", "val"}:
+                leaks.append((a, b, distance))
+        print(f"{len(conflicts)} possible labeling errors")
+        for a, b, distance in conflicts:
+            print(
+                f"  {a['path']} ({a['label']}) looks like {b['path']} "
+                f"({b['label']}), {distance} bits apart"
+            )
+        print(f"{len(leaks)} near-identical pairs across train and val")
+        for a, b, distance in leaks:
+            print(f"  {a['path']} ~ {b['path']}, {distance} bits apart")
+
+        for kept, path in duplicates:
+            if not args.dedupe:
+                print(f"  {path} duplicates {kept}")
+                continue
+            destination = os.path.join(
+                args.duplicates_dir, os.path.relpath(path, project_root)
+            )
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(path, destination)
+            index.remove(path)
+        if args.dedupe:
+            print(f"Moved duplicates to {args.duplicates_dir}")
+
+
+if __name__ == "__main__":
+    main()
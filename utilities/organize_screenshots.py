@@ -1,49 +1,79 @@
 import os
 import glob
-import time
-from PIL import Image
-import tensorflow as tf
+import sys
 
+from dotenv import load_dotenv
 
-def load_model(model_path):
-    return tf.keras.models.load_model(model_path)
-
-
-def classify_image(model, image_path):
-    image = Image.open(image_path)
-    resized_image = image.resize((224, 224), Image.ANTIALIAS)
-    input_data = tf.keras.preprocessing.image.img_to_array(resized_image)
-    input_data = input_data / 255.0
-    input_data = input_data.reshape((1, *input_data.shape))
-    prediction = model.predict(input_data)
-    return prediction
-
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def organize_screenshots(screenshot_folder, model):
-    screenshot_files = glob.glob(f"{screenshot_folder}/*.jpg")
+from batch_classifier import (  # noqa: E402
+    BatchClassifier,
+    FileMover,
+    ResultsManifest,
+)
+from capture import parse_roi  # noqa: E402
+from dataset_index import DatasetIndex  # noqa: E402
+from inference import load_backend  # noqa: E402
 
-    for screenshot_file in screenshot_files:
-        prediction = classify_image(model, screenshot_file)
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-        if (
-            prediction[0][0] > 0.5
-        ):  # Adjust this threshold according to your model's output
-            label = "queue_pop"
-        else:
-            label = "not_queue_pop"
 
-        label_folder = os.path.join(screenshot_folder, label)
-        if not os.path.exists(label_folder):
-            os.makedirs(label_folder)
-
-        file_name = os.path.join(
-            label_folder, os.path.basename(screenshot_file)
-        )
-        os.rename(screenshot_file, file_name)
-        print(f"Moved {screenshot_file} to {file_name}")
+def load_model(model_path):
+    return load_backend(model_path)
+
+
+def organize_screenshots(
+    screenshot_folder, model, batch_size=64, index=None, model_path=None
+):
+    screenshot_files = sorted(glob.glob(f"{screenshot_folder}/*.jpg"))
+    # Crop to CAPTURE_ROI, the region the model was trained on
+    roi = parse_roi(os.environ.get("CAPTURE_ROI"))
+
+    # Scores are recorded in a manifest as they come in, so an interrupted
+    # run picks up where it left off; it starts over when model_path or the
+    # ROI changed since
+    manifest = ResultsManifest(
+        os.path.join(screenshot_folder, "organize_manifest.jsonl"),
+        model_path=model_path,
+        roi=roi,
+    )
+    classifier = BatchClassifier(model, batch_size, roi=roi, manifest=manifest)
+    mover = FileMover()
+
+    try:
+        for screenshot_file, prediction in classifier.scores(screenshot_files):
+            if prediction is None:
+                print(f"Could not read {screenshot_file}")
+                continue
+
+            if (
+                prediction > 0.5
+            ):  # Adjust this threshold according to your model's output
+                label = "queue_pop"
+            else:
+                label = "not_queue_pop"
+
+            file_name = os.path.join(
+                screenshot_folder, label, os.path.basename(screenshot_file)
+            )
+            mover.move(screenshot_file, file_name)
+            if index is not None:
+                index.record_prediction(
+                    screenshot_file, prediction, model.name
+                )
+                index.move(screenshot_file, file_name, project_root)
+    finally:
+        mover.close()
+        manifest.close()
+        if index is not None:
+            index.commit()
+
+    print(classifier.stats())
+    print(f"Moved {mover.moved} screenshots ({mover.failed} failed)")
 
 
 def main():
+    load_dotenv()
     screenshot_folder = "screenshots"
     model_path = "queue_pop_detector.h5"
 
@@ -54,7 +84,13 @@ def main():
         return
 
     model = load_model(model_path)
-    organize_screenshots(screenshot_folder, model)
+    with DatasetIndex(
+        os.path.join(project_root, "dataset_index.sqlite3")
+    ) as index:
+        index.sync(project_root, [screenshot_folder])
+        organize_screenshots(
+            screenshot_folder, model, index=index, model_path=model_path
+        )
 
 
 if __name__ == "__main__":
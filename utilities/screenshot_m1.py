@@ -1,43 +1,133 @@
-import time
+import argparse
 import os
-from PIL import ImageGrab, Image
-from screeninfo import get_monitors
+import sys
+import time
 from datetime import datetime
 
+import cv2
+from dotenv import load_dotenv
 
-def take_screenshot(screenshot_folder, monitor):
-    left, top, right, bottom = (
-        monitor.x,
-        monitor.y,
-        monitor.x + monitor.width,
-        monitor.y + monitor.height,
-    )
-    screenshot = ImageGrab.grab(bbox=(left, top, right, bottom))
-    screenshot = screenshot.resize(
-        (screenshot.width // 2, screenshot.height // 2), Image.ANTIALIAS
-    )
-    file_name = f"{screenshot_folder}/screenshot_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.jpg"
-    screenshot.save(file_name, "JPEG", quality=50)
-    print(f"Screenshot saved as {file_name}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from capture import ScreenCapture, crop_roi, parse_roi  # noqa: E402
+from dataset_index import hamming, perceptual_hash  # noqa: E402
+from inference import load_backend, preprocess  # noqa: E402
+from screenshot_writer import ScreenshotWriter  # noqa: E402
 
-def main():
-    screenshot_folder = "screenshots"
+# Harvest training screenshots. Frames come from one persistent mss grabber
+# and are only saved when their perceptual hash differs from the last saved
+# frame by more than --min-distance bits, so a quiet screen doesn't produce
+# thousands of identical files. With --label-model, each saved frame is
+# pre-sorted into queue_pop/not_queue_pop by the model's score.
+
+
+class Harvester:
+    def __init__(
+        self, screenshot_folder, min_distance=6, model=None, roi=None
+    ):
+        self.screenshot_folder = screenshot_folder
+        self.min_distance = min_distance
+        self.model = model
+        self.roi = roi
+        self.writer = ScreenshotWriter(quality=50)
+        self.last_hash = None
+        self.frames = 0
+        self.saved = 0
+
+    def label(self, frame):
+        img = preprocess(frame, self.model.input_size, self.roi)
+        score = self.model.predict_one(img)
+        return "queue_pop" if score > 0.5 else "not_queue_pop", score
+
+    def take_screenshot(self, frame):
+        self.frames += 1
+        # Compare the CAPTURE_ROI region the model sees: a dialog that fills
+        # a small part of the screen barely moves a full-frame hash
+        frame_hash = perceptual_hash(crop_roi(frame, self.roi))
+        if (
+            self.last_hash is not None
+            and hamming(frame_hash, self.last_hash) <= self.min_distance
+        ):
+            return None
 
-    if not os.path.exists(screenshot_folder):
-        os.makedirs(screenshot_folder)
+        folder, suffix = self.screenshot_folder, ""
+        if self.model is not None:
+            label, score = self.label(frame)
+            folder = os.path.join(folder, label)
+            suffix = f"_score_{score:.2f}"
 
-    monitors = get_monitors()
-    if len(monitors) < 1:
-        print("No monitors found.")
-        return
+        screenshot = cv2.resize(
+            frame,
+            (frame.shape[1] // 2, frame.shape[0] // 2),
+            interpolation=cv2.INTER_AREA,
+        )
+        file_name = os.path.join(
+            folder,
+            f"screenshot_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')}"
+            f"{suffix}.jpg",
+        )
+        if not self.writer.save(file_name, screenshot):
+            return None
+        self.last_hash = frame_hash
+        self.saved += 1
+        return file_name
 
-    monitor1 = monitors[0]
+    def close(self):
+        self.writer.close()
+        print(
+            f"Saved {self.saved} of {self.frames} frames; "
+            f"{self.writer.stats()}"
+        )
 
-    interval = 5  # Set the interval between screenshots, in seconds
-    while True:
-        take_screenshot(screenshot_folder, monitor1)
-        time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Save screenshots when the screen changes"
+    )
+    parser.add_argument("--folder", default="screenshots")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5,
+        help="seconds between screenshots",
+    )
+    parser.add_argument("--monitor", type=int, default=0)
+    parser.add_argument(
+        "--min-distance",
+        type=int,
+        default=6,
+        help="perceptual hash bits that must differ from the last save",
+    )
+    parser.add_argument(
+        "--label-model",
+        help="pre-label frames into queue_pop/not_queue_pop with this model",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    model = load_backend(args.label_model) if args.label_model else None
+
+    harvester = Harvester(
+        args.folder,
+        args.min_distance,
+        model,
+        roi=parse_roi(os.environ.get("CAPTURE_ROI")),
+    )
+    capture = ScreenCapture(monitor_index=args.monitor)
+    deadline = time.monotonic()
+    try:
+        while True:
+            file_name = harvester.take_screenshot(capture.grab())
+            if file_name:
+                print(f"Screenshot saved as {file_name}")
+            # Keep a steady cadence; if a frame overran, start over from now
+            deadline = max(deadline + args.interval, time.monotonic())
+            time.sleep(max(deadline - time.monotonic(), 0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.close()
+        harvester.close()
 
 
 if __name__ == "__main__":
@@ -1,61 +1,62 @@
 import os
-import cv2
-import numpy as np
-import shutil
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_classifier import BatchClassifier, FileMover  # noqa: E402
+from capture import parse_roi  # noqa: E402
+from dataset_index import IMAGE_EXTENSIONS  # noqa: E402
+from inference import load_backend  # noqa: E402
+
+load_dotenv()
 
 # Get the directory path of the current script file
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
 # Load the trained model
-model = load_model(os.path.join(script_dir, "queue_pop_detector.h5"))
+model = load_backend(os.path.join(script_dir, "queue_pop_detector.h5"))
+
+
+def image_paths(directory):
+    # Stream paths instead of listing every entry up front
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(
+                IMAGE_EXTENSIONS
+            ):
+                yield entry.path
 
 
 # Define a function to test for false negatives
-def test_false_negatives(directory, verbose=False):
+def test_false_negatives(directory, verbose=False, batch_size=64):
     print(directory)
 
-    # Create an ImageDataGenerator for loading the images from disk
-    datagen = ImageDataGenerator(rescale=1.0 / 255)
-
-    # Load the images in batches using flow_from_directory
-    generator = datagen.flow_from_directory(
-        directory,
-        target_size=(224, 224),
-        batch_size=32,
-        class_mode="binary",
-        shuffle=False,
-        interpolation="nearest",
-        color_mode="rgb",
-    )
-
-    # Load all the images in the directory into a numpy array
-    images = []
-    for filename in os.listdir(directory):
-        if filename.endswith((".jpg", ".png")):
-            img_path = os.path.join(directory, filename)
-            img = cv2.imread(img_path, cv2.IMREAD_COLOR)
-            img = cv2.resize(img, (224, 224))
-            images.append(img)
-    images = np.array(images)
-
-    # Predict the labels for each image in the numpy array
-    preds = model.predict(
-        datagen.flow(images, batch_size=32, shuffle=False), verbose=0
+    # Images are decoded a batch at a time and every score stays paired with
+    # its own path, so memory is bounded by the batch size rather than the
+    # size of the directory. Images are cropped to CAPTURE_ROI, the region
+    # the model was trained on.
+    classifier = BatchClassifier(
+        model, batch_size, roi=parse_roi(os.environ.get("CAPTURE_ROI"))
     )
+    mover = FileMover()
+    destination = os.path.join(script_dir, "false_negatives")
 
-    # Loop over the predictions and filenames and print the filenames of any false negatives
-    for pred, filename in zip(preds, generator.filenames):
-        if pred > 0.5:
+    try:
+        for img_path, pred in classifier.scores(image_paths(directory)):
+            if pred is None or pred <= 0.5:
+                continue
+            filename = os.path.basename(img_path)
             if verbose:
                 print(f"{filename} is a false negative")
             else:
                 print(filename)
-                shutil.move(
-                    os.path.join(directory, filename),
-                    os.path.join(script_dir, "false_negatives"),
-                )
+                mover.move(img_path, os.path.join(destination, filename))
+    finally:
+        mover.close()
+
+    print(classifier.stats())
 
 
 # Test for false negatives in the train directory
@@ -1,36 +1,50 @@
 import os
+import sys
 from pathlib import Path
 from datetime import datetime
-import itertools
 
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
 
-def unique_image_names(directory):
-    images = itertools.chain(
-        directory.glob("*.[jJ][pP][gG]"),
-        directory.glob("*.[pP][nN][gG]"),
-    )
+from dataset_index import DatasetIndex  # noqa: E402
 
-    for idx, image_path in enumerate(sorted(images)):
-        creation_time = datetime.fromtimestamp(os.path.getctime(image_path))
+
+def unique_image_names(index, split, category):
+    # Name each image after its modification time and content hash. Both
+    # survive a rename, so files that already have their name are left
+    # alone and running this again is a no-op.
+    renamed = 0
+    for path in index.paths(split, category):
+        image_path = Path(path)
+        row = index.get(path)
+        modified = datetime.fromtimestamp(os.path.getmtime(image_path))
         new_image_path = (
             image_path.parent
-            / f"screenshots_{creation_time.strftime('%Y%m%d_%H%M%S')}_{idx}{image_path.suffix}"
+            / f"screenshots_{modified.strftime('%Y%m%d_%H%M%S')}_{row['content_hash'][:8]}{image_path.suffix.lower()}"
         )
+        if new_image_path == image_path:
+            continue
+        if new_image_path.exists():
+            # Identical content already has this name; leave the copy for
+            # utilities/index_dataset.py to deduplicate
+            continue
         image_path.rename(new_image_path)
+        index.move(image_path, new_image_path)
+        renamed += 1
+    index.commit()
+    return renamed
 
 
 def main():
-    project_root = Path(__file__).resolve().parent.parent
-    train_dir = project_root / "train"
-    val_dir = project_root / "val"
     categories = ["queue_pop", "not_queue_pop"]
 
-    for category in categories:
-        print(f"Renaming images in train/{category}...")
-        unique_image_names(train_dir / category)
-
-        print(f"Renaming images in val/{category}...")
-        unique_image_names(val_dir / category)
+    with DatasetIndex(str(project_root / "dataset_index.sqlite3")) as index:
+        index.sync(project_root, ("train", "val"))
+        for split in ["train", "val"]:
+            for category in categories:
+                print(f"Renaming images in {split}/{category}...")
+                renamed = unique_image_names(index, split, category)
+                print(f"Renamed {renamed} images")
 
 
 if __name__ == "__main__":
@@ -2,180 +2,595 @@ import os
 import cv2
 import numpy as np
 import time
-from tensorflow.keras.models import load_model
-import pychromecast
-import screeninfo
-import mss
 import sys
 import subprocess
+import urllib.parse
+import urllib.request
+from collections import Counter
 from dotenv import load_dotenv
 import chump
 
+from audio_server import AudioServer, lan_ip_for, local_clip_url
+from capture import ForegroundWatcher, ScreenCapture, parse_roi
+from cast_manager import CastManager
+from detection import (
+    decider_from_env,
+    detector_from_env,
+    frame_gate_from_env,
+    handle_detection,
+    scheduler_from_env,
+    template_source_from_env,
+)
+from inference import load_backend
+from inference_server import RemoteBackend
+from metrics import (
+    Metrics,
+    MetricsDumper,
+    MetricsServer,
+    SamplingProfiler,
+    ScoreHistogram,
+    counter,
+    gauge,
+    latency_histogram,
+    summary,
+)
+from notifications import NotificationDispatcher
+from pipeline import FrameProcessor, Pipeline
+from screenshot_writer import FrameHistory, ScreenshotWriter
+from shared_frames import SharedFrameSource
+from startup import Startup
+
 load_dotenv()
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Load the trained model
-model = load_model(os.environ["MODEL_PATH"])
+# Independent startup steps run concurrently: the model loads and warms up
+# on one worker while the Pushover user is looked up and the notification
+# clips are cached on others, and CastManager finds the Google Home in the
+# background. Capture starts as soon as the model is ready; each
+# notification channel waits for its own step. A timeline is printed once
+# the first frame has been processed.
+startup = Startup()
+
+# Load the trained model; the backend (Keras, TFLite or ONNX) is picked from
+# the MODEL_PATH extension. With INFERENCE_SERVER set, frames are scored by a
+# shared inference_server.py process instead and no model is loaded here.
+inference_server = os.environ.get("INFERENCE_SERVER")
+
+
+def load_model():
+    if inference_server:
+        # Connects on the first frame; INPUT_SIZE must match the served
+        # model
+        input_size = int(os.environ.get("INPUT_SIZE", "224"))
+        return RemoteBackend(
+            inference_server,
+            os.environ.get("INFERENCE_CLIENT_NAME"),
+            input_size=(input_size, input_size),
+        )
+    return load_backend(os.environ["MODEL_PATH"])
+
+
+model_future = startup.submit("model load", load_model)
 
 # Set up Pushover notifications
 pushover_user_key = os.environ["PUSHOVER_USER_KEY"]
 pushover_app_token = os.environ["PUSHOVER_APP_TOKEN"]
 
+
+def connect_pushover():
+    # Validates the app token and user key (a network round trip). chump
+    # doesn't raise for a rejected token or key, it only marks them
+    # unauthenticated, so check that here.
+    app = chump.Application(pushover_app_token)
+    if not app.is_authenticated:
+        raise ValueError("PUSHOVER_APP_TOKEN was rejected by Pushover")
+    user = app.get_user(pushover_user_key)
+    if not user.is_authenticated:
+        raise ValueError("PUSHOVER_USER_KEY was rejected by Pushover")
+    return user
+
+
+def report_pushover_lookup(future):
+    # The lookup runs in the background; make a bad token or key stand out
+    # instead of leaving it to the first notification
+    error = future.exception()
+    if isinstance(error, ValueError):
+        startup.mark(f"Pushover configuration error: {error}")
+
+
+pushover_future = startup.submit("pushover user lookup", connect_pushover)
+pushover_future.add_done_callback(report_pushover_lookup)
+PUSHOVER_MESSAGES_URL = "https://api.pushover.net/1/messages.json"
+
 google_home_name = os.environ["GOOGLE_HOME_NAME"]
 
-cast_device = None
 
-last_notification_time = time.time()
-max_retries = 5
-retries = 0
-app = chump.Application(pushover_app_token)
-user = app.get_user(pushover_user_key)
+def set_max_volume(cast):
+    # set the maximum volume
+    max_volume = 1.0  # this sets the max volume to 100%
+    cast.set_volume(max_volume)
+
+
+def on_cast_connect(cast):
+    startup.mark("google home connected")
+    set_max_volume(cast)
+
+
+# Connect to the Google Home in the background. Its address is cached in
+# CAST_CACHE_PATH so later launches skip discovery, and dropped connections
+# are re-established without interrupting detection.
+cast_manager = CastManager(
+    google_home_name,
+    cache_path=os.environ.get("CAST_CACHE_PATH", "cast_device.json"),
+    prelaunch=os.environ.get("CAST_PRELAUNCH", "1") == "1",
+    on_connect=on_cast_connect,
+).start()
+
+# Download the notification clips once (on a startup worker) and serve them
+# from this machine, so the Google Home doesn't follow Google Drive
+# redirects on every pop. SETUP_COMPLETE_AUDIO and QUEUE_POPPED_AUDIO may be
+# URLs or local files. If the port is taken the clips are streamed from
+# their original URLs instead.
+audio_server = None
+try:
+    audio_server = AudioServer(
+        os.environ.get("AUDIO_CACHE_DIR", "audio_cache"),
+        os.environ.get("AUDIO_SERVER_HOST")
+        or lan_ip_for(cast_manager.cached_host or "8.8.8.8"),
+        int(os.environ.get("AUDIO_SERVER_PORT", "8765")),
+    )
+except OSError as e:
+    print(f"Audio server not started, streaming the clips instead: {e}")
+
+
+def cache_clips():
+    return {
+        "setup_complete": local_clip_url(
+            os.environ.get(
+                "SETUP_COMPLETE_AUDIO",
+                "https://drive.google.com/uc?export=download&id=1aBcBldLNUscpeDRg6ddFT9PflRWA_ZU4",
+            ),
+            audio_server,
+        ),
+        "queue_popped": local_clip_url(
+            os.environ.get(
+                "QUEUE_POPPED_AUDIO",
+                "https://drive.google.com/uc?export=download&id=1J2JillCdrW-_ulNi1HdNyXodj20RDUqu",
+            ),
+            audio_server,
+        ),
+    }
+
+
+clips_future = startup.submit("audio clips", cache_clips)
+
+# The frame gate, decider and scheduler (see detection.py) are configured
+# from the environment the same way replays configure them
+decider = decider_from_env()
+frame_gate = frame_gate_from_env()
+scheduler = scheduler_from_env()
+# The scheduler slows down while the game (GAME_WINDOW_TITLE) isn't focused
+foreground = ForegroundWatcher(
+    os.environ.get("GAME_WINDOW_TITLE", "World of Warcraft")
+)
+
+stats_report_interval = float(os.environ.get("STATS_REPORT_SECONDS", "300"))
+last_stats_report = time.monotonic()
+
+
+def open_capture():
+    # Capture only the region where the queue pop dialog appears, given in
+    # CAPTURE_ROI as "left,top,width,height" in pixels or fractions of the
+    # monitor
+    return ScreenCapture(
+        monitor_index=int(os.environ.get("CAPTURE_MONITOR", "0")),
+        roi=parse_roi(os.environ.get("CAPTURE_ROI")),
+    )
+
 
 # Create a directory to store queue popped screenshots
 screenshot_folder = "screenshots"
 if not os.path.exists(screenshot_folder):
     os.makedirs(screenshot_folder)
 
+# Pop screenshots are written from a background thread. With
+# POP_HISTORY_SECONDS set, the frames captured in the seconds before each
+# pop are saved alongside it for labeling.
+screenshot_writer = ScreenshotWriter(
+    quality=int(os.environ.get("SCREENSHOT_QUALITY", "90")), size=64
+)
+pop_history_seconds = float(os.environ.get("POP_HISTORY_SECONDS", "0"))
+frame_history = (
+    FrameHistory(pop_history_seconds) if pop_history_seconds > 0 else None
+)
 
-while retries < max_retries:
-    chromecasts, browser = pychromecast.get_listed_chromecasts(
-        friendly_names=[google_home_name]
-    )
-    if chromecasts:
-        cast_device = chromecasts[0]
-        break
+# Everything from here on needs the model
+with startup.step("waiting for model"):
+    model = model_future.result()
+
+# Optionally recognize the pop dialog by template matching against the
+# labeled train/queue_pop screenshots (TEMPLATE_MATCHING, TEMPLATE_SOURCE)
+# and only run the model when the template score is ambiguous
+templates = template_source_from_env()
+detector = model
+if templates:
+    with startup.step("template matcher"):
+        detector = detector_from_env(model, templates)
+    if detector is not model:
+        count = len(detector.matcher.templates)
+        print(f"Template matching with {count} templates")
     else:
-        retries += 1
+        print("No queue pop templates found; using the model only")
+
+
+def play_tts_on_google_home(clip, timeout=24):
+    # Start playback of a cached clip and wait until the device reports it
+    # is playing. The channel passes a timeout shorter than its own, so a
+    # slow cast fails here first.
+    start = time.monotonic()
+    deadline = start + timeout
+    url = clips_future.result(timeout)[clip]
+    cast_device = cast_manager.get(max(deadline - time.monotonic(), 0))
+    cast_device.media_controller.play_media(url, "audio/mp3")
+    while time.monotonic() < deadline:
+        if cast_device.media_controller.status.player_state == "PLAYING":
+            print(f"Audio started in {time.monotonic() - start:.2f}s: {url}")
+            return
+        time.sleep(0.1)
+    raise TimeoutError(f"'{google_home_name}' did not start playing {url}")
+
+
+def send_pushover_notification(message, timeout=10):
+    # Create an emergency message with the given message
+    # and send it to the user with emergency priority. Waits for the
+    # startup lookup of the user, and repeats the lookup if it failed.
+    # chump's send_message has no request timeout, so the message is posted
+    # to the Pushover API directly within the channel's deadline.
+    global pushover_future
+    deadline = time.monotonic() + timeout
+    if pushover_future.done() and pushover_future.exception():
+        pushover_future = startup.submit(
+            "pushover user lookup", connect_pushover
+        )
+        pushover_future.add_done_callback(report_pushover_lookup)
+    pushover_future.result(timeout)
+    data = urllib.parse.urlencode(
+        {
+            "token": pushover_app_token,
+            "user": pushover_user_key,
+            "message": message,
+            "priority": chump.NORMAL,
+        }
+    ).encode()
+    with urllib.request.urlopen(
+        PUSHOVER_MESSAGES_URL,
+        data,
+        timeout=max(deadline - time.monotonic(), 0.1),
+    ) as response:
+        response.read()
+
+
+# Send notifications from background workers so a slow Pushover request or
+# an unresponsive Google Home never stalls capture and inference
+notifications = NotificationDispatcher()
+notifications.add_channel(
+    "pushover",
+    send_pushover_notification,
+    timeout=float(os.environ.get("PUSHOVER_TIMEOUT_SECONDS", "10")),
+    retries=int(os.environ.get("NOTIFY_RETRIES", "2")),
+)
+notifications.add_channel(
+    "google_home",
+    play_tts_on_google_home,
+    timeout=float(os.environ.get("GOOGLE_HOME_TIMEOUT_SECONDS", "30")),
+    retries=int(os.environ.get("NOTIFY_RETRIES", "2")),
+)
+
+
+def save_queue_popped_screenshot(result):
+    # Queue the captured frame (not the model's normalized input) and any
+    # recent frames for the background writer
+    name = f"queue_popped_{int(time.time())}_pred_{result.score:.2f}"
+    screenshot_filepath = os.path.join(screenshot_folder, f"{name}.jpg")
+    if screenshot_writer.save(screenshot_filepath, keep(result.frame)):
+        print(f"Queue popped screenshot queued for {screenshot_filepath}")
+    if frame_history:
+        history_folder = os.path.join(screenshot_folder, f"{name}_history")
+        for captured_at, frame in frame_history.snapshot():
+            offset = captured_at - result.captured_at
+            screenshot_writer.save(
+                os.path.join(history_folder, f"frame_{offset:+.2f}s.jpg"),
+                frame,
+            )
+
+
+def keep(frame):
+    # Frames from the capture process are views into its shared ring and
+    # get overwritten; copy any that are held on to
+    return frame.copy() if capture_process else frame
+
+
+def handle_result(result):
+    # Called for every processed frame, from the inference thread when the
+    # pipeline is enabled
+    counts["frames"] += 1
+    if counts["frames"] == 1:
+        startup.mark("first frame")
+        print(startup.timeline())
+    if result.classified:
+        counts["inferences"] += 1
+        score_histogram.record(result.score)
+    if frame_history:
+        frame_history.add(result.captured_at, keep(result.frame))
+    if result.popped:
         print(
-            f"No device named '{google_home_name}' found. Retrying in 5 seconds..."
+            f"Queue popped (score {result.score:.2f}, decided in "
+            f"{decider.last_latency or 0.0:.2f}s)"
         )
-        time.sleep(5)
 
-if not cast_device:
-    print(
-        f"Could not find '{google_home_name}' after {max_retries} retries. Exiting."
+    # Reschedule, and notify if queue has popped
+    handle_detection(
+        result,
+        scheduler,
+        notifications.notify,
+        foreground=foreground.is_foreground(),
     )
-    sys.exit(1)
-else:
-    print(f"Found '{google_home_name}'!")
-    # Start socket client's worker thread and wait for initial status update
-    cast_device.wait()
 
-# set the maximum volume
-max_volume = 1.0  # this sets the max volume to 100%
-cast_device.set_volume(max_volume)
+    if result.popped:
+        # Only after the notifications are on their way
+        save_queue_popped_screenshot(result)
 
 
-def play_tts_on_google_home(url):
-    has_played = False
-    player_state = None
-    t = 30
-    cast_device.media_controller.play_media(url, "audio/mp3")
-    while has_played is False:
-        try:
-            if (
-                player_state
-                != cast_device.media_controller.status.player_state
-            ):
-                player_state = cast_device.media_controller.status.player_state
-            if player_state == "PLAYING":
-                has_played = True
-            if (
-                cast_device.socket_client.is_connected
-                and has_played
-                and player_state != "PLAYING"
-            ):
-                has_played = False
-                cast_device.media_controller.play_media(url, "audio/mp3")
-
-            time.sleep(0.1)
-            t = t - 0.1
-        except Exception:
-            break
-    else:
-        print(f"The file {url} does not exist. Please check the file path.")
+def print_stats():
+    # Report how often the frame gate let frames through, how well the
+    # capture cadence is being kept and where each frame's time goes
+    print(frame_gate.stats())
+    print(scheduler.stats())
+    print(f"Stage timings:\n{processor.timings.summary()}")
+    if detector is not model:
+        print(detector.stats())
+    if pipeline:
+        print(pipeline.stats())
+    if capture_process:
+        print(capture.stats())
+    print(screenshot_writer.stats())
+    if inference_server:
+        print(model.stats())
 
 
-def send_pushover_notification(message):
-    # Create an emergency message with the given message
-    # and send it to the user with emergency priority
-    user.send_message(message, priority=chump.NORMAL)
+def collect_metrics():
+    # Read the counters the components already keep; runs on the metrics
+    # endpoint and dumper threads
+    captured = capture.ring.latest if capture_process else None
+    samples = [
+        counter(
+            "notifier_frames_captured_total",
+            "Frames captured",
+            scheduler.total_frames if captured is None else captured,
+        ),
+        counter(
+            "notifier_frames_processed_total",
+            "Frames run through the detection path",
+            counts["frames"],
+        ),
+        counter(
+            "notifier_frames_skipped_total",
+            "Frames the frame gate kept from the model",
+            frame_gate.skips,
+        ),
+        counter(
+            "notifier_inferences_total",
+            "Frames scored by the detector",
+            counts["inferences"],
+        ),
+        counter("notifier_pops_total", "Queue pops detected", decider.pops),
+        counter(
+            "notifier_capture_overruns_total",
+            "Frames that took longer than their capture period",
+            scheduler.total_overruns,
+        ),
+        gauge(
+            "notifier_capture_period_seconds",
+            "Current capture period",
+            scheduler.period,
+        ),
+        gauge(
+            "notifier_cast_ready",
+            "Whether the Google Home is connected",
+            int(cast_manager.ready.is_set()),
+        ),
+        counter(
+            "notifier_cast_reconnects_total",
+            "Google Home reconnects",
+            cast_manager.reconnects,
+        ),
+        counter(
+            "notifier_screenshots_dropped_total",
+            "Pop screenshots dropped because the writer was behind",
+            screenshot_writer.dropped,
+        ),
+    ]
+    samples += score_histogram.samples(
+        "notifier_score", "Detector score of classified frames"
+    )
+    for stage, histogram in processor.timings.histograms.items():
+        samples += latency_histogram(
+            "notifier_stage_seconds",
+            "Time spent per frame in each stage",
+            histogram,
+            stage=stage,
+        )
+    for name, channel in notifications.channels.items():
+        samples += [
+            counter(
+                "notifier_notifications_sent_total",
+                "Notifications delivered",
+                channel.sent,
+                channel=name,
+            ),
+            counter(
+                "notifier_notifications_failed_total",
+                "Notifications that failed after all retries",
+                channel.failed,
+                channel=name,
+            ),
+            counter(
+                "notifier_notifications_abandoned_total",
+                "Sends left running past the channel timeout",
+                channel.abandoned,
+                channel=name,
+            ),
+        ]
+        samples += summary(
+            "notifier_notification_seconds",
+            "Time from queueing a notification to its delivery",
+            sum(channel.latencies),
+            len(channel.latencies),
+            channel=name,
+        )
+    if detector is not model:
+        samples.append(
+            counter(
+                "notifier_template_fallbacks_total",
+                "Frames the template matcher left to the model",
+                detector.fallbacks,
+            )
+        )
+    if pipeline:
+        samples.append(
+            counter(
+                "notifier_pipeline_dropped_total",
+                "Frames replaced before the next stage picked them up",
+                pipeline.captured.dropped + pipeline.prepared.dropped,
+            )
+        )
+    if inference_server:
+        samples += latency_histogram(
+            "notifier_remote_inference_seconds",
+            "Round trip to the inference server",
+            model.latency,
+        )
+    return samples
+
 
+# Frame and inference counts and the score distribution, for the metrics
+counts = Counter()
+score_histogram = ScoreHistogram()
+
+processor = FrameProcessor(
+    detector, frame_gate, decider, on_result=handle_result
+)
 
-def save_queue_popped_screenshot(img, pred):
-    screenshot_filename = (
-        f"queue_popped_{int(time.time())}_pred_{pred:.2f}.jpg"
+# With CAPTURE_PROCESS=1 the screen is grabbed in a separate process that
+# hands frames over through shared memory, paced by the scheduler's period.
+# Otherwise, with PIPELINE=1 (the default) capture, preprocessing and
+# inference run on separate threads so inference on one frame overlaps
+# capture of the next.
+capture_process = os.environ.get("CAPTURE_PROCESS", "0") == "1"
+pipeline = None
+capture = None
+if capture_process:
+    capture = SharedFrameSource.for_screen(
+        monitor_index=int(os.environ.get("CAPTURE_MONITOR", "0")),
+        roi=parse_roi(os.environ.get("CAPTURE_ROI")),
+        period=scheduler.period,
     )
-    screenshot_filepath = os.path.join(screenshot_folder, screenshot_filename)
-    cv2.imwrite(screenshot_filepath, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
-    print(f"Queue popped screenshot saved to {screenshot_filepath}")
+elif os.environ.get("PIPELINE", "1") == "1":
+    pipeline = Pipeline(processor, open_capture, scheduler).start()
+else:
+    capture = open_capture()
 
+# Metrics are served in Prometheus text format on
+# http://127.0.0.1:METRICS_PORT/metrics (METRICS_PORT=0 disables it) and,
+# with METRICS_JSON_PATH set, appended there as JSON lines every
+# METRICS_JSON_SECONDS. SIGUSR1 or GET /profile?seconds=N on the metrics
+# port writes a sampling profile of every thread to PROFILE_DIR.
+metrics = Metrics()
+metrics.register(collect_metrics)
+profiler = SamplingProfiler(
+    os.environ.get("PROFILE_DIR", "profiles"),
+    seconds=float(os.environ.get("PROFILE_SECONDS", "30")),
+)
+profiler.install()
+metrics_server = None
+metrics_port = int(os.environ.get("METRICS_PORT", "9108"))
+if metrics_port:
+    try:
+        metrics_server = MetricsServer(
+            metrics, metrics_port, profiler=profiler
+        )
+        print(f"Metrics on http://127.0.0.1:{metrics_server.port}/metrics")
+    except OSError as e:
+        print(f"Metrics endpoint not started: {e}")
+metrics_dumper = None
+if os.environ.get("METRICS_JSON_PATH"):
+    metrics_dumper = MetricsDumper(
+        metrics,
+        os.environ["METRICS_JSON_PATH"],
+        float(os.environ.get("METRICS_JSON_SECONDS", "60")),
+    )
 
 # Play "Setup complete" MP3
-play_tts_on_google_home(
-    "https://drive.google.com/uc?export=download&id=1aBcBldLNUscpeDRg6ddFT9PflRWA_ZU4"
+notifications.notify("google_home", "setup_complete")
+notifications.notify(
+    "pushover", "Setup complete. Ready to receive notifications."
 )
-send_pushover_notification("Setup complete. Ready to receive notifications.")
 
-# Continuously check for a queue pop every 5 seconds in a loop:
+# Continuously check for a queue pop in a loop:
+seq = 0
 while True:
     try:
-        # Take a screenshot
-        monitor = screeninfo.get_monitors()[0]
-        left, top, width, height = (
-            monitor.x,
-            monitor.y,
-            monitor.width,
-            monitor.height,
-        )
-        # Take a screenshot with 50% image quality
-        with mss.mss() as sct:
-            monitor = {
-                "top": top,
-                "left": left,
-                "width": width,
-                "height": height,
-                "capture_every": 1,
-                "quality": 50,
-            }
-            screenshot = sct.grab(monitor)
-        img = np.array(screenshot)
-
-        # Preprocess the screenshot
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = cv2.resize(img, (224, 224))
-        img = img / 255.0
-
-        # Make a prediction
-        pred = model.predict(np.expand_dims(img, axis=0))[0][0]
-
-        # Notify if queue has popped
-        if pred >= 0.95 and time.time() - last_notification_time >= 15:
-            save_queue_popped_screenshot(img, pred)
-            send_pushover_notification("The queue has popped!")
-
-            # Play "Queue popped" WAV
-            play_tts_on_google_home(
-                "https://drive.google.com/uc?export=download&id=1J2JillCdrW-_ulNi1HdNyXodj20RDUqu"
-            )
+        if pipeline:
+            # The pipeline threads do the work; just report periodically
+            time.sleep(min(stats_report_interval, 1.0))
+        elif capture_process:
+            # grab() waits for the capture process's next frame
+            img = capture.grab()
+            seq += 1
+            processor.process(img, seq, capture.captured_at)
+            capture.period = scheduler.period
+        else:
+            # Take a screenshot of the configured region
+            start = time.perf_counter()
+            img = capture.grab()
+            processor.timings.record("capture", time.perf_counter() - start)
+            seq += 1
+            processor.process(img, seq)
+
+        if time.monotonic() - last_stats_report >= stats_report_interval:
+            print_stats()
+            last_stats_report = time.monotonic()
 
     except KeyboardInterrupt:
+        if pipeline:
+            pipeline.stop()
+        else:
+            capture.close()
+        print_stats()
+        print(decider.stats())
+        print(notifications.stats())
+        print(cast_manager.stats())
+        notifications.stop()
+        screenshot_writer.close()
+        if metrics_dumper:
+            metrics_dumper.close()
+        if metrics_server:
+            metrics_server.close()
+        if audio_server:
+            audio_server.close()
+        foreground.close()
+        startup.shutdown()
         # Disconnect from the Chromecast
-        try:
-            browser.stop_discovery()
-            cast_device.disconnect()
-        except Exception:
-            pass
+        cast_manager.close()
         sys.exit(0)
     except Exception as e:
+        # Keep detecting; the cast connection recovers on its own
         print(f"Exception: {e}")
-        try:
-            browser.stop_discovery()
-            cast_device.disconnect()
-        except Exception:
-            pass
-        sys.exit(1)
-
-    # Wait 1 second before the next iteration
-    time.sleep(1)
+        if capture_process:
+            # grab() normally paces this loop; don't spin while it fails
+            time.sleep(scheduler.period)
+
+    # Wait for the next frame's deadline
+    if not pipeline and not capture_process:
+        scheduler.wait()